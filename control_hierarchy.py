@@ -0,0 +1,105 @@
+"""
+Maya independent control hierarchies for rings of controls.
+
+Every frequency-th control of a ring is a main control, and the controls in
+between are children blended between the main controls on either side. The
+hierarchy, blend weights and names are solved in one pass over the ring.
+"""
+
+
+def blend_weights(index, frequency):
+    """Weights of a ring position between the main controls around it.
+
+    The weight of the previous main control falls off linearly from 1.0 at
+    that control, as parent_index - index / frequency where parent_index
+    counts the main controls up to and including the position.
+
+    Args:
+        index (int): Position in the ring.
+        frequency (int): Number of positions per main control.
+
+    Returns:
+        tuple: Weight of the previous and of the next main control.
+    """
+    parent_index = index // frequency + 1
+    weight = parent_index - float(index) / frequency
+    return weight, 1.0 - weight
+
+
+def control_names(prefix, index):
+    """Names of the nodes of the control at a ring position."""
+    return {
+        "name": "{0}_main{1:0>2}_ctrl".format(prefix, index),
+        "group": "{0}_main{1:0>2}_grp".format(prefix, index),
+        "null": "{0}_main{1:0>2}_null".format(prefix, index)
+    }
+
+
+class RingHierarchy(object):
+    """Main and child controls of a ring.
+
+    Args:
+        count (int): Number of controls in the ring.
+        frequency (int): Every frequency-th control, starting from the first,
+            is a main control.
+
+    Attributes:
+        main_indices (list): Ring positions of the main controls.
+        child_indices (list): Ring positions of the child controls.
+        parents (list): Per ring position, [main control number, weight]
+            pairs of the next and the previous main control. Empty for main
+            controls. The last children blend back to the first main control.
+    """
+
+    def __init__(self, count, frequency=1):
+        self.count = count
+        self.frequency = frequency
+        self.main_indices = []
+        self.child_indices = []
+        self.parents = []
+
+        main_count = len(range(0, count, frequency))
+        for index in range(count):
+            if index % frequency == 0:
+                self.main_indices.append(index)
+                self.parents.append([])
+                continue
+
+            self.child_indices.append(index)
+            previous_weight, next_weight = blend_weights(index, frequency)
+            previous_main = index // frequency
+            self.parents.append(
+                [
+                    [(previous_main + 1) % main_count, next_weight],
+                    [previous_main, previous_weight]
+                ]
+            )
+
+    def build_order(self):
+        """Ring positions with the main controls first.
+
+        The main control numbers in parents are positions in this order.
+        """
+        return self.main_indices + self.child_indices
+
+    def is_main(self, index):
+        return index % self.frequency == 0
+
+    def controls(self, prefix):
+        """Hierarchy as data, in build order.
+
+        Args:
+            prefix (str): Prefix of the names.
+
+        Returns:
+            list: Dictionaries with the ring position as "index", the names
+                and the parents of every control.
+        """
+        results = []
+        for index in self.build_order():
+            data = control_names(prefix, index)
+            data["index"] = index
+            data["parents"] = self.parents[index]
+            results.append(data)
+
+        return results
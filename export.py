@@ -1,177 +1,692 @@
+from array import array
+import argparse
+import concurrent.futures
+import hashlib
 import os
 import shutil
 import json
+import subprocess
+import tempfile
+import threading
+import time
 
 import pymel.core as pc
 from maya import cmds
-from ngSkinTools2 import api as ngst_api
 from studiolibrarymaya import poseitem, animitem
 from mgear.shifter import guide_manager
 
+import ngskintools_worker
+import skin_weights
 
-def main():
-    basename = os.path.basename(pc.sceneName())
-    filename = os.path.splitext(basename)[0]
-    directory = os.path.dirname(pc.sceneName())
-
-    if not os.path.exists(os.path.join(directory, filename)):
-        os.makedirs(os.path.join(directory, filename))
-
-    # Export connections.
-    if pc.objExists("connections"):
-        json_data = []
-        valid_attributes = [
-            "translate",
-            "translateX",
-            "translateY",
-            "translateZ",
-            "rotate",
-            "rotateX",
-            "rotateY",
-            "rotateZ",
-            "scale",
-            "scaleX",
-            "scaleY",
-            "scaleZ",
-            "visibility",
-            "worldInverseMatrix"
-        ]
-
-        for node in pc.PyNode("connections").members():
-            connections = node.listConnections(
-                source=True, destination=False, plugs=True, connections=True
-            )
 
-            # Valid attributes.
-            for target, source in connections:
-                if source.attrName(longName=True) not in valid_attributes:
-                    continue
+MANIFEST_VERSION = 1
 
-                exclude_node_types = ["nodeGraphEditorInfo", "objectSet"]
-                if source.node().nodeType() in exclude_node_types:
-                    continue
+# Registered export sections, in the order they run.
+EXPORTERS = []
 
-                json_data.append(
-                    {"source": str(source), "target": str(target)}
-                )
 
-            # User defined attributes.
-            for target, source in connections:
-                if source not in source.node().listAttr(userDefined=True):
-                    continue
-
-                data = {
-                    "source": str(source),
-                    "target": str(target),
-                    "keyable": target.get(keyable=True),
-                    "channelBox": target.get(channelBox=True),
-                    "defaultValue": cmds.attributeQuery(
-                        str(source).split(".")[1],
-                        node=str(source.node()),
-                        listDefault=True
-                    )[0],
-                    "attributeType": target.type()
-                }
-                json_data.append(data)
-
-        path = os.path.join(directory, filename, "connections.json")
-        with open(path, "w") as f:
-            json.dump(json_data, f, sort_keys=True, indent=4)
-
-    # ngskintools export
-    if pc.objExists("ngskintools"):
-        path = os.path.join(directory, filename, "ngskintools")
+def exporter(name, sets=None, fingerprint=None, outputs=None):
+    """Register a function as an export section.
+
+    The function gets the export directory, queries the scene and returns a
+    dictionary of json data by file path relative to the export directory,
+    or None when it has nothing to write. Files a section has to write
+    itself are returned as an Output of a temporary path. Writing is left
+    to the Writer so it overlaps with the next section.
+
+    Args:
+        name (str): Name of the section.
+        sets (list): Object sets the section reads.
+        fingerprint (callable): Returns a cheap json summary of the state
+            the output depends on, like connection lists or attribute values.
+            Sections without sets or fingerprint always run, also when
+            exporting changed sections only.
+        outputs (callable): Returns the paths a section writes itself, which
+            have to exist for the section to be skipped.
+    """
+    def register(function):
+        EXPORTERS.append(
+            {
+                "name": name,
+                "function": function,
+                "sets": sets,
+                "fingerprint": fingerprint,
+                "outputs": outputs
+            }
+        )
+        return function
+
+    return register
+
+
+class Output(object):
+    """A file a section wrote itself to a temporary path.
+
+    The Writer moves it into place, unless it matches the previous export.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def set_fingerprint(sets=None, fingerprint=None):
+    """Cheap hash of the object sets a section reads.
+
+    Covers the existence, members and data attribute of the sets, plus the
+    member state the fingerprint callable of the section returns.
+    """
+    data = []
+    for name in sets or []:
+        if not cmds.objExists(name):
+            data.append([name, None, None])
+            continue
+
+        value = None
+        if cmds.attributeQuery("data", node=name, exists=True):
+            value = cmds.getAttr(name + ".data")
+        data.append([name, sorted(cmds.sets(name, query=True) or []), value])
+
+    if fingerprint is not None:
+        data.append(fingerprint())
+
+    return content_hash(json.dumps(data, sort_keys=True).encode("utf-8"))
+
+
+def read_manifest(directory):
+    """Manifest of the previous export, or an empty manifest."""
+    manifest = {"version": MANIFEST_VERSION, "sections": {}}
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return manifest
+
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("version") != MANIFEST_VERSION:
+        return manifest
+
+    return data
+
+
+def write_manifest(directory, manifest):
+    """Write the manifest, leaving the file alone when it is unchanged."""
+    path = os.path.join(directory, "manifest.json")
+    text = json.dumps(manifest, sort_keys=True, indent=4)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            if f.read() == text:
+                return
+
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class Writer(object):
+    """Serializes and writes files on background threads.
+
+    At most max_pending files are queued, so the scene queries can run ahead
+    of the disk without holding the data of every section in memory. Files
+    whose content hash matches the previous export are not rewritten.
+
+    Args:
+        hashes (dict): Content hash per path of the previous export.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, hashes=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.hashes = hashes or {}
+
+    def _unchanged(self, path, digest, text=False):
+        if self.hashes.get(os.path.normpath(path)) != digest:
+            return False
         if not os.path.exists(path):
-            os.makedirs(path)
-
-        for mesh in pc.PyNode("ngskintools").members():
-            print("Exporting ngskintools on: {}".format(mesh.name()))
-
-            mesh_name = mesh.name()
-            # Handle namespaces by creating subfolders
-            if ":" in mesh_name:
-                name_parts = mesh_name.split(":")
-                # Create subdirectory path for namespaces
-                namespace_path = os.path.join(path, *name_parts[:-1])
-                if not os.path.exists(namespace_path):
-                    os.makedirs(namespace_path)
-                # Use the last part as the filename
-                filepath = os.path.join(namespace_path, "{}.json".format(name_parts[-1]))
+            return False
+
+        # The file may have been edited or replaced since the manifest was
+        # written, so the manifest alone does not prove it is current. Json
+        # is read back as text, as it was hashed before newline translation.
+        if text:
+            with open(path, "r") as f:
+                return content_hash(f.read().encode("utf-8")) == digest
+
+        with open(path, "rb") as f:
+            return content_hash(f.read()) == digest
+
+    def _write(self, path, data):
+        try:
+            start = time.perf_counter()
+            if isinstance(data, Output):
+                with open(data.path, "rb") as f:
+                    digest = content_hash(f.read())
+                written = not self._unchanged(path, digest)
+                if written:
+                    os.replace(data.path, path)
+                else:
+                    os.remove(data.path)
             else:
-                filepath = os.path.join(path, "{}.json".format(mesh_name))
-            
-            try:
-                ngst_api.export_json(mesh.name(), file=filepath)
-                # Check if file was actually created
-                if not os.path.exists(filepath):
-                    cmds.warning("ngskintools export failed for '{}' - mesh may not have ngskintools setup".format(mesh.name()))
-            except Exception as e:
-                cmds.warning("ngskintools export failed for '{}' - {}".format(mesh.name(), str(e)))
-
-    # Export constraints.
+                text = json.dumps(data, sort_keys=True, indent=4)
+                digest = content_hash(text.encode("utf-8"))
+                written = not self._unchanged(path, digest, text=True)
+                if written:
+                    with open(path, "w") as f:
+                        f.write(text)
+
+            return digest, written, time.perf_counter() - start
+        finally:
+            self.slots.release()
+
+    def submit(self, path, data):
+        """Queue a json file or Output, blocking while the queue is full.
+
+        Returns:
+            Future: Resolves to the content hash, whether the file was
+                written and the seconds spent.
+        """
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.slots.acquire()
+        try:
+            return self.executor.submit(self._write, path, data)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def shutdown(self):
+        """Wait for all queued files to be written."""
+        self.executor.shutdown(wait=True)
+
+
+def _members(set_name):
+    if not cmds.objExists(set_name):
+        return []
+    return cmds.sets(set_name, query=True) or []
+
+
+def connections_state():
+    """Incoming connections of the connections set members."""
+    members = _members("connections")
+    if not members:
+        return None
+
+    return cmds.listConnections(
+        members, source=True, destination=False, plugs=True, connections=True
+    ) or []
+
+
+@exporter("connections", sets=["connections"], fingerprint=connections_state)
+def export_connections(directory):
+    if not pc.objExists("connections"):
+        return None
+
     json_data = []
-    constraint_types = [
-        "parentConstraint",
-        "pointConstraint",
-        "orientConstraint",
-        "scaleConstraint"
+    valid_attributes = [
+        "translate",
+        "translateX",
+        "translateY",
+        "translateZ",
+        "rotate",
+        "rotateX",
+        "rotateY",
+        "rotateZ",
+        "scale",
+        "scaleX",
+        "scaleY",
+        "scaleZ",
+        "visibility",
+        "worldInverseMatrix"
     ]
-    if pc.objExists("constraints"):
-        for node in pc.PyNode("constraints").members():
-            constraints = []
-            for constraint_type in constraint_types:
-                if node.listRelatives(type=constraint_type):
-                    constraints.append(
-                        node.listRelatives(type=constraint_type)[0]
+
+    exclude_node_types = ["nodeGraphEditorInfo", "objectSet"]
+
+    # Source nodes are shared by many connections, so what is queried per
+    # source node or attribute is only queried once.
+    node_types = {}
+    user_attributes = {}
+    defaults = {}
+
+    def is_excluded(source_node):
+        name = str(source_node)
+        if name not in node_types:
+            node_types[name] = source_node.nodeType() in exclude_node_types
+        return node_types[name]
+
+    def is_user_defined(source):
+        name = str(source.node())
+        if name not in user_attributes:
+            user_attributes[name] = set(
+                str(x) for x in source.node().listAttr(userDefined=True)
+            )
+        return str(source) in user_attributes[name]
+
+    def default_value(source):
+        node_name = str(source.node())
+        attribute = str(source).split(".")[1]
+        key = (node_name, attribute)
+        if key not in defaults:
+            defaults[key] = cmds.attributeQuery(
+                attribute, node=node_name, listDefault=True
+            )[0]
+        return defaults[key]
+
+    for node in pc.PyNode("connections").members():
+        connections = node.listConnections(
+            source=True, destination=False, plugs=True, connections=True
+        )
+
+        # Valid attributes first, then user defined attributes, in one walk.
+        valid_data = []
+        user_data = []
+        for target, source in connections:
+            if source.attrName(longName=True) in valid_attributes:
+                if not is_excluded(source.node()):
+                    valid_data.append(
+                        {"source": str(source), "target": str(target)}
                     )
 
-            for constraint in constraints:
-                data = {
-                    "type": constraint.nodeType().replace("Constraint", ""),
-                    "sources": [],
-                    "target": node.name()
-                }
-
-                # Scale constraints do not have interpType.
-                if hasattr(constraint, "interpType"):
-                    data["interp_type"] = constraint.interpType.get()
-
-                method = getattr(pc, constraint.nodeType())
-                targets = method(constraint, query=True, targetList=True)
-                data["constraint_attributes"] = {}
-                for target in targets:
-                    data["sources"].append(
-                        {
-                            "node": target.name(),
-                            "weight": method(
-                                constraint, query=True, weight=target
-                            )
-                        }
+            if not is_user_defined(source):
+                continue
+
+            data = {
+                "source": str(source),
+                "target": str(target),
+                "keyable": target.get(keyable=True),
+                "channelBox": target.get(channelBox=True),
+                "defaultValue": default_value(source),
+                "attributeType": target.type()
+            }
+            user_data.append(data)
+
+        json_data.extend(valid_data)
+        json_data.extend(user_data)
+
+    return {"connections.json": json_data}
+
+
+def ngskintools_path(directory, mesh_name):
+    """Path of the ngskintools export of a mesh.
+
+    Namespaces become subfolders of the ngskintools folder.
+    """
+    path = os.path.join(directory, "ngskintools")
+
+    # Handle namespaces by creating subfolders
+    if ":" in mesh_name:
+        name_parts = mesh_name.split(":")
+        # Create subdirectory path for namespaces
+        namespace_path = os.path.join(path, *name_parts[:-1])
+        # Use the last part as the filename
+        return os.path.join(namespace_path, "{}.json".format(name_parts[-1]))
+
+    return os.path.join(path, "{}.json".format(mesh_name))
+
+
+def mayapy_path():
+    """Path of the mayapy of the running Maya."""
+    executable = "mayapy.exe" if os.name == "nt" else "mayapy"
+    return os.path.join(os.environ["MAYA_LOCATION"], "bin", executable)
+
+
+def _run_ngskintools_worker(scene, jobs, folder):
+    """Export jobs in a mayapy process.
+
+    Returns:
+        dict: Failure message per mesh name.
+    """
+    handle, jobs_path = tempfile.mkstemp(suffix=".json", dir=folder)
+    os.close(handle)
+    report_path = os.path.splitext(jobs_path)[0] + "_report.json"
+    with open(jobs_path, "w") as f:
+        json.dump(jobs, f)
+
+    process = subprocess.run(
+        [
+            mayapy_path(),
+            os.path.abspath(ngskintools_worker.__file__),
+            scene,
+            jobs_path,
+            report_path
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True
+    )
+
+    if not os.path.exists(report_path):
+        lines = (process.stdout or "").strip().splitlines()
+        message = "worker exited with code {}: {}".format(
+            process.returncode, lines[-1] if lines else "no output"
+        )
+        return dict((job["mesh"], message) for job in jobs)
+
+    with open(report_path, "r") as f:
+        return json.load(f)["failures"]
+
+
+def export_ngskintools_parallel(jobs, workers):
+    """Export jobs across mayapy worker processes.
+
+    Each worker opens the saved scene and exports an equal share of the
+    meshes.
+
+    Args:
+        jobs (list): Dictionaries with the "mesh" to export and the "path"
+            to export to.
+        workers (int): Number of worker processes.
+
+    Returns:
+        dict: Failure message per mesh name.
+    """
+    failures = {}
+    scene = cmds.file(query=True, sceneName=True)
+    chunks = [jobs[index::workers] for index in range(workers)]
+    chunks = [chunk for chunk in chunks if chunk]
+    if not chunks:
+        return failures
+
+    folder = tempfile.mkdtemp()
+    try:
+        # Threads only wait on the processes.
+        with concurrent.futures.ThreadPoolExecutor(len(chunks)) as executor:
+            futures = [
+                executor.submit(_run_ngskintools_worker, scene, chunk, folder)
+                for chunk in chunks
+            ]
+            for future in futures:
+                failures.update(future.result())
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return failures
+
+
+def ngskintools_state():
+    """Influences and a hash of the skin weights of the meshes.
+
+    Layers are summarized by the final weights they produce.
+    """
+    state = []
+    for mesh in _members("ngskintools"):
+        history = cmds.listHistory(mesh) or []
+        for skin_cluster in cmds.ls(history, type="skinCluster") or []:
+            weights = skin_weights.get_weights(skin_cluster, mesh)
+            state.append(
+                [
+                    mesh,
+                    skin_cluster,
+                    cmds.skinCluster(skin_cluster, query=True, influence=True),
+                    content_hash(array("d", weights).tobytes())
+                ]
+            )
+
+    return state
+
+
+@exporter("ngskintools", sets=["ngskintools"], fingerprint=ngskintools_state)
+def export_ngskintools(directory, workers=0):
+    """Export the ngskintools layers of the meshes in the ngskintools set.
+
+    Args:
+        directory (str): Export directory.
+        workers (int): Number of mayapy processes to export with. Exports
+            in this session when 0, or when the scene has unsaved changes
+            the workers would not see.
+    """
+    if not pc.objExists("ngskintools"):
+        return None
+
+    jobs = []
+    for mesh in pc.PyNode("ngskintools").members():
+        filepath = ngskintools_path(directory, mesh.name())
+        if not os.path.exists(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+
+        # Export next to the file, so unchanged files are left alone.
+        jobs.append({"mesh": mesh.name(), "path": filepath + ".tmp"})
+
+    if workers and cmds.file(query=True, modified=True):
+        cmds.warning(
+            "Scene has unsaved changes, exporting ngskintools without "
+            "workers."
+        )
+        workers = 0
+
+    print(
+        "Exporting ngskintools on {} mesh(es) with {} worker(s).".format(
+            len(jobs), workers
+        )
+    )
+    files = {}
+    try:
+        if workers:
+            failures = export_ngskintools_parallel(jobs, workers)
+        else:
+            failures = ngskintools_worker.export_meshes(jobs)
+
+        if failures:
+            cmds.warning(
+                "ngskintools export failed for {} mesh(es):\n{}".format(
+                    len(failures),
+                    "\n".join(
+                        "    {} - {}".format(mesh, message)
+                        for mesh, message in sorted(failures.items())
                     )
-                    if constraint.nodeType() == "parentConstraint":
-                        index = targets.index(target)
-                        target_data = {}
-                        target = constraint.target[index]
-                        target_data["targetOffsetTranslate"] = list(
-                            target.targetOffsetTranslate.get()
-                        )
-                        target_data["targetOffsetRotate"] = list(
-                            target.targetOffsetRotate.get()
-                        )
-                        key = "target[{}]".format(index)
-                        data["constraint_attributes"][key] = target_data
-
-                json_data.append(data)
-
-    path = os.path.join(directory, filename, "constraints.json")
-    with open(path, "w") as f:
-        json.dump(json_data, f, sort_keys=True, indent=4)
+                )
+            )
+
+        for job in jobs:
+            if job["mesh"] in failures or not os.path.exists(job["path"]):
+                continue
+
+            filepath = job["path"][:-len(".tmp")]
+            files[os.path.relpath(filepath, directory)] = Output(job["path"])
+    finally:
+        # Failed exports can leave partial files, which the Writer never
+        # sees.
+        outputs = set(output.path for output in files.values())
+        for job in jobs:
+            if job["path"] not in outputs and os.path.exists(job["path"]):
+                os.remove(job["path"])
+
+    return files
+
+
+# Constraint types exported, in the order they are read per node.
+CONSTRAINT_TYPES = [
+    "parentConstraint",
+    "pointConstraint",
+    "orientConstraint",
+    "scaleConstraint"
+]
 
-    # Extract controls.
+# Scale and point constraints do not have interpType.
+INTERP_TYPE_CONSTRAINTS = ["parentConstraint", "orientConstraint"]
+
+
+def _is_offset(values, identity, tolerance=1e-6):
+    return any(abs(x - identity) > tolerance for x in values)
+
+
+def constraint_data(constraint, constraint_type, target):
+    """Export data of a constraint node.
+
+    The targets, weights and offsets are read as plain attribute values
+    rather than through the constraint command. maintainOffset is derived
+    from the offsets, as the constraint does not store it.
+
+    Args:
+        constraint (str): Full path of the constraint node.
+        constraint_type (str): Node type of the constraint.
+        target (str): Name of the constrained node.
+
+    Returns:
+        dict: Constraint data.
+    """
+    method = getattr(cmds, constraint_type)
+    targets = method(constraint, query=True, targetList=True) or []
+    aliases = method(constraint, query=True, weightAliasList=True) or []
+
+    data = {
+        "type": constraint_type.replace("Constraint", ""),
+        "sources": [],
+        "target": target,
+        "constraint_attributes": {}
+    }
+
+    if constraint_type in INTERP_TYPE_CONSTRAINTS:
+        data["interp_type"] = cmds.getAttr(constraint + ".interpType")
+
+    offsets = []
+    for index, (source, alias) in enumerate(zip(targets, aliases)):
+        data["sources"].append(
+            {
+                "node": source,
+                "weight": cmds.getAttr("{0}.{1}".format(constraint, alias))
+            }
+        )
+
+        if constraint_type == "parentConstraint":
+            plug = "{0}.target[{1}]".format(constraint, index)
+            target_data = {
+                "targetOffsetTranslate": list(
+                    cmds.getAttr(plug + ".targetOffsetTranslate")[0]
+                ),
+                "targetOffsetRotate": list(
+                    cmds.getAttr(plug + ".targetOffsetRotate")[0]
+                )
+            }
+            key = "target[{}]".format(index)
+            data["constraint_attributes"][key] = target_data
+            offsets.extend(target_data["targetOffsetTranslate"])
+            offsets.extend(target_data["targetOffsetRotate"])
+
+    if constraint_type == "parentConstraint":
+        data["maintainOffset"] = _is_offset(offsets, 0.0)
+    else:
+        identity = 1.0 if constraint_type == "scaleConstraint" else 0.0
+        data["maintainOffset"] = _is_offset(
+            cmds.getAttr(constraint + ".offset")[0], identity
+        )
+
+    return data
+
+
+def constraints_state():
+    """Targets, weights, interp types and offsets of the constraints."""
+    members = _members("constraints")
+    if not members:
+        return None
+
+    constraints = cmds.listRelatives(
+        members, type=CONSTRAINT_TYPES, fullPath=True
+    ) or []
+    if not constraints:
+        return []
+
+    state = [
+        constraints,
+        cmds.listConnections(
+            constraints,
+            source=True,
+            destination=False,
+            plugs=True,
+            connections=True
+        ) or []
+    ]
+    for constraint in constraints:
+        # The target weights are the user defined attributes.
+        for attribute in cmds.listAttr(constraint, userDefined=True) or []:
+            state.append(cmds.getAttr("{0}.{1}".format(constraint, attribute)))
+
+        constraint_type = cmds.nodeType(constraint)
+        if constraint_type in INTERP_TYPE_CONSTRAINTS:
+            state.append(cmds.getAttr(constraint + ".interpType"))
+
+        if constraint_type != "parentConstraint":
+            state.append(cmds.getAttr(constraint + ".offset"))
+            continue
+
+        indices = cmds.getAttr(constraint + ".target", multiIndices=True)
+        for index in indices or []:
+            plug = "{0}.target[{1}]".format(constraint, index)
+            state.append(cmds.getAttr(plug + ".targetOffsetTranslate"))
+            state.append(cmds.getAttr(plug + ".targetOffsetRotate"))
+
+    return state
+
+
+@exporter("constraints", sets=["constraints"], fingerprint=constraints_state)
+def export_constraints(directory):
+    json_data = []
+    if not pc.objExists("constraints"):
+        return {"constraints.json": json_data}
+
+    nodes = pc.PyNode("constraints").members()
+    if not nodes:
+        return {"constraints.json": json_data}
+
+    # List the constraints under all members at once, keeping the first
+    # constraint of each type per member.
+    paths = [node.longName() for node in nodes]
+    constraints = {}
+    listing = cmds.ls(
+        cmds.listRelatives(paths, type=CONSTRAINT_TYPES, fullPath=True) or [],
+        long=True,
+        showType=True
+    )
+    for constraint, constraint_type in zip(listing[::2], listing[1::2]):
+        parent = constraint.rsplit("|", 1)[0]
+        constraints.setdefault(parent, {}).setdefault(
+            constraint_type, constraint
+        )
+
+    for node, path in zip(nodes, paths):
+        node_constraints = constraints.get(path, {})
+        for constraint_type in CONSTRAINT_TYPES:
+            if constraint_type not in node_constraints:
+                continue
+
+            json_data.append(
+                constraint_data(
+                    node_constraints[constraint_type],
+                    constraint_type,
+                    node.name()
+                )
+            )
+
+    return {"constraints.json": json_data}
+
+
+# Extracting controls updates the guide in the scene rather than writing
+# files, so it always runs.
+@exporter("controls")
+def export_controls(directory):
     pc.select(pc.PyNode("rig_controllers_grp").members())
     guide_manager.extract_controls()
 
-    # Export display layers.
+
+def display_layers_state():
+    """Members, visibility and display type of the display layers."""
+    state = []
+    for layer in sorted(cmds.ls(type="displayLayer") or []):
+        state.append(
+            [
+                layer,
+                cmds.getAttr(layer + ".visibility"),
+                cmds.getAttr(layer + ".displayType"),
+                cmds.editDisplayLayerMembers(layer, query=True) or []
+            ]
+        )
+    return state
+
+
+@exporter("display_layers", fingerprint=display_layers_state)
+def export_display_layers(directory):
     display_layers = {}
     for layer in pc.ls(type="displayLayer"):
         # Skip default layer
@@ -186,65 +701,137 @@ def main():
         for node in layer.listMembers():
             display_layers[layer.name()]["members"].append(node.name())
 
-    if display_layers:
-        path = os.path.join(directory, filename, "display_layers.json")
-        with open(path, "w") as f:
-            json.dump(display_layers, f, sort_keys=True, indent=4)
-
-    # Extract parents.
-    if pc.objExists("parents"):
-        data = []
-        for node in pc.PyNode("parents").members():
-            data.append(
-                {"child": node.name(), "parent": node.getParent().name()}
-            )
+    if not display_layers:
+        return None
 
-        path = os.path.join(directory, filename, "parents.json")
-        with open(path, "w") as f:
-            json.dump(data, f, sort_keys=True, indent=4)
+    return {"display_layers.json": display_layers}
 
-    # Extract extra parents.
-    if pc.objExists("extra_parents"):
-        data = []
-        for node in pc.PyNode("extra_parents").members():
-            if "controlBuffer" in node.name():
-                continue
-            data.append(node.name())
 
-        path = os.path.join(directory, filename, "extra_parents.json")
-        with open(path, "w") as f:
-            json.dump(data, f, sort_keys=True, indent=4)
+@exporter("parents", sets=["parents"])
+def export_parents(directory):
+    if not pc.objExists("parents"):
+        return None
 
-    # Shrinkwrap rig.
-    if pc.objExists("shrinkwraps"):
-        folder = os.path.join(directory, filename, "shrinkwraps")
+    data = []
+    for node in pc.PyNode("parents").members():
+        data.append(
+            {"child": node.name(), "parent": node.getParent().name()}
+        )
+
+    return {"parents.json": data}
+
+
+@exporter("extra_parents", sets=["extra_parents"])
+def export_extra_parents(directory):
+    if not pc.objExists("extra_parents"):
+        return None
+
+    data = []
+    for node in pc.PyNode("extra_parents").members():
+        if "controlBuffer" in node.name():
+            continue
+        data.append(node.name())
+
+    return {"extra_parents.json": data}
 
-        if not os.path.exists(folder):
-            os.makedirs(folder)
 
-        for data in json.loads(pc.PyNode("shrinkwraps").data.get()):
-            path = os.path.join(folder, data["prefix"] + ".shrinkwrap")
-            with open(path, "w") as f:
-                json.dump(data, f, sort_keys=True, indent=4)
+@exporter("shrinkwraps", sets=["shrinkwraps"])
+def export_shrinkwraps(directory):
+    if not pc.objExists("shrinkwraps"):
+        return None
 
-    # Eyes rig.
-    if pc.objExists("eyes"):
-        data = json.loads(pc.PyNode("eyes").data.get())
-        for basename in data:
-            path = os.path.join(directory, filename, basename)
-            with open(path, "w") as f:
-                json.dump(data[basename], f, sort_keys=True, indent=4)
+    folder = os.path.join(directory, "shrinkwraps")
+    if not os.path.exists(folder):
+        os.makedirs(folder)
 
-    # studiolibrary export
+    files = {}
+    for data in json.loads(pc.PyNode("shrinkwraps").data.get()):
+        path = os.path.join("shrinkwraps", data["prefix"] + ".shrinkwrap")
+        files[path] = data
+
+    return files
+
+
+@exporter("eyes", sets=["eyes"])
+def export_eyes(directory):
+    if not pc.objExists("eyes"):
+        return None
+
+    return json.loads(pc.PyNode("eyes").data.get())
+
+
+def studiolibrary_mode():
     modes = ["final", "wip"]
-    mode = modes[pc.PyNode("guide").mode.get()]
+    return modes[pc.PyNode("guide").mode.get()]
+
+
+def studiolibrary_path(directory):
+    mode = studiolibrary_mode()
     export_type = "anim" if mode == "wip" else "pose"
-    path = os.path.join(
+    return os.path.join(
         directory,
-        filename,
         "studiolibrary",
         "{}.{}".format(mode, export_type)
     )
+
+
+def studiolibrary_state():
+    """Mode, frame range, keyable values and animation of the controls."""
+    members = _members("studiolibrary")
+    state = [
+        studiolibrary_mode(),
+        cmds.playbackOptions(query=True, minTime=True),
+        cmds.playbackOptions(query=True, maxTime=True)
+    ]
+    for member in members:
+        for attribute in cmds.listAttr(member, keyable=True) or []:
+            try:
+                value = cmds.getAttr("{0}.{1}".format(member, attribute))
+            except (RuntimeError, ValueError):
+                continue
+            state.append([member, attribute, value])
+
+    if members:
+        for flag in ["timeChange", "valueChange"]:
+            state.append(
+                cmds.keyframe(members, query=True, **{flag: True}) or []
+            )
+        for flag in [
+            "inAngle",
+            "outAngle",
+            "inWeight",
+            "outWeight",
+            "inTangentType",
+            "outTangentType",
+            "weightedTangents",
+            "lock"
+        ]:
+            state.append(
+                cmds.keyTangent(members, query=True, **{flag: True}) or []
+            )
+        for flag in ["preInfinite", "postInfinite"]:
+            state.append(
+                cmds.setInfinity(members, query=True, **{flag: True}) or []
+            )
+
+    return state
+
+
+def studiolibrary_outputs(directory):
+    if not pc.objExists("studiolibrary"):
+        return []
+    return [studiolibrary_path(directory)]
+
+
+@exporter(
+    "studiolibrary",
+    sets=["studiolibrary"],
+    fingerprint=studiolibrary_state,
+    outputs=studiolibrary_outputs
+)
+def export_studiolibrary(directory):
+    mode = studiolibrary_mode()
+    path = studiolibrary_path(directory)
     exporter = poseitem.PoseItem(path)
     options = {}
 
@@ -273,15 +860,170 @@ def main():
 
         exporter.save(**options)
 
-    if pc.objExists("exclude_controls"):
-        data = []
-        for node in pc.PyNode("exclude_controls").members():
-            data.append(node.name())
 
-        path = os.path.join(directory, filename, "exclude_controls.json")
-        with open(path, "w") as f:
-            json.dump(data, f, sort_keys=True, indent=4)
+@exporter("exclude_controls", sets=["exclude_controls"])
+def export_exclude_controls(directory):
+    if not pc.objExists("exclude_controls"):
+        return None
+
+    data = []
+    for node in pc.PyNode("exclude_controls").members():
+        data.append(node.name())
+
+    return {"exclude_controls.json": data}
+
+
+def print_timings(timings):
+    """Print the query and write seconds per section."""
+    print("Export timings:")
+    for name, query_seconds, write_seconds, written, file_count in timings:
+        print(
+            "    {0:<20} query {1:>8.3f}s  write {2:>8.3f}s  "
+            "{3}/{4} file(s) written".format(
+                name, query_seconds, write_seconds, written, file_count
+            )
+        )
+    print(
+        "    {0:<20} query {1:>8.3f}s  write {2:>8.3f}s".format(
+            "total",
+            sum(x[1] for x in timings),
+            sum(x[2] for x in timings)
+        )
+    )
+
+
+def _section_unchanged(directory, previous, fingerprint, outputs=None):
+    if previous is None or previous.get("fingerprint") != fingerprint:
+        return False
+
+    paths = [os.path.join(directory, path) for path in previous["files"]]
+    if outputs is not None:
+        paths.extend(outputs(directory))
+
+    return all(os.path.exists(path) for path in paths)
+
+
+def main(changed_only=False,
+         max_workers=2,
+         max_pending=8,
+         ngskintools_workers=0):
+    """Export the rig data of the open scene.
+
+    A manifest.json in the export folder records a content hash per section
+    and per file, so unchanged files are not rewritten.
+
+    Args:
+        changed_only (bool): Skip sections whose object sets have not
+            changed since the previous export, going by the set members and
+            the member state their fingerprints cover.
+        max_workers (int): Number of writer threads.
+        max_pending (int): Maximum number of files queued for writing.
+        ngskintools_workers (int): Number of mayapy processes exporting
+            ngskintools. Exports in this session when 0.
+    """
+    basename = os.path.basename(pc.sceneName())
+    filename = os.path.splitext(basename)[0]
+    directory = os.path.join(os.path.dirname(pc.sceneName()), filename)
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    previous_sections = read_manifest(directory)["sections"]
+    hashes = {}
+    for section in previous_sections.values():
+        for path, digest in section["files"].items():
+            hashes[os.path.normpath(os.path.join(directory, path))] = digest
+
+    # Sections query the scene on this thread, while the files of earlier
+    # sections are written in the background.
+    section_options = {"ngskintools": {"workers": ngskintools_workers}}
+    manifest = {"version": MANIFEST_VERSION, "sections": {}}
+    sections = []
+    writer = Writer(max_workers, max_pending, hashes)
+    try:
+        for section in EXPORTERS:
+            name = section["name"]
+            fingerprint = None
+            if section["sets"] or section["fingerprint"]:
+                fingerprint = set_fingerprint(
+                    section["sets"], section["fingerprint"]
+                )
+
+            previous = previous_sections.get(name)
+            if changed_only and fingerprint is not None and (
+                _section_unchanged(
+                    directory, previous, fingerprint, section["outputs"]
+                )
+            ):
+                print("Skipping unchanged section: {}".format(name))
+                manifest["sections"][name] = previous
+                continue
+
+            start = time.perf_counter()
+            options = section_options.get(name, {})
+            files = section["function"](directory, **options) or {}
+            query_seconds = time.perf_counter() - start
+
+            futures = [
+                (path, writer.submit(os.path.join(directory, path), data))
+                for path, data in sorted(files.items())
+            ]
+            sections.append((name, fingerprint, query_seconds, futures))
+    finally:
+        writer.shutdown()
+
+    # Results raise any errors from writing.
+    timings = []
+    for name, fingerprint, query_seconds, futures in sections:
+        file_hashes = {}
+        write_seconds = 0.0
+        written = 0
+        for path, future in futures:
+            digest, file_written, seconds = future.result()
+            file_hashes[path.replace(os.sep, "/")] = digest
+            write_seconds += seconds
+            written += file_written
+
+        manifest["sections"][name] = {
+            "hash": content_hash(
+                json.dumps(file_hashes, sort_keys=True).encode("utf-8")
+            ),
+            "fingerprint": fingerprint,
+            "files": file_hashes
+        }
+        timings.append(
+            (name, query_seconds, write_seconds, written, len(futures))
+        )
+
+    write_manifest(directory, manifest)
+    print_timings(timings)
+    return timings
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Export the rig data of the open scene."
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="Skip sections that have not changed since the previous "
+        "export. Sections are compared by their set members and a cheap "
+        "summary of member state: connection lists, constraint weights and "
+        "offsets, skin weights, display layers, and studiolibrary values "
+        "and animation curves. Other changes to members, like attribute "
+        "flags or parents, are not detected. Control extraction always "
+        "runs."
+    )
+    parser.add_argument(
+        "--ngskintools-workers",
+        type=int,
+        default=0,
+        help="Number of mayapy processes exporting ngskintools."
+    )
+    # Maya and mGear pass arguments of their own when running this script.
+    args, _ = parser.parse_known_args()
+    main(
+        changed_only=args.changed_only,
+        ngskintools_workers=args.ngskintools_workers
+    )
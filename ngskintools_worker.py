@@ -0,0 +1,88 @@
+"""
+Headless ngskintools export of meshes from a saved scene.
+
+export.py hands chunks of the ngskintools meshes to workers running this
+script in mayapy. Each worker opens the scene, exports the layers of its
+meshes and writes a report of the failures instead of warning per mesh.
+The scene is never saved.
+
+Usage:
+    mayapy ngskintools_worker.py scene.ma jobs.json report.json
+
+jobs.json schema:
+[
+    {
+        "mesh": "body_geo",
+        "path": "/path/to/rig/ngskintools/body_geo.json.tmp"
+    }
+]
+
+report.json schema:
+{
+    "failures": {
+        "body_geo": "mesh may not have ngskintools setup"
+    }
+}
+"""
+
+import json
+import os
+import sys
+
+
+def export_meshes(jobs):
+    """Export the ngskintools layers of meshes in the open scene.
+
+    Args:
+        jobs (list): Dictionaries with the "mesh" to export and the "path"
+            to export to.
+
+    Returns:
+        dict: Failure message per mesh name.
+    """
+    from ngSkinTools2 import api as ngst_api
+
+    failures = {}
+    for job in jobs:
+        try:
+            ngst_api.export_json(job["mesh"], file=job["path"])
+        except Exception as e:
+            failures[job["mesh"]] = str(e)
+            continue
+
+        # Check if file was actually created
+        if not os.path.exists(job["path"]):
+            failures[job["mesh"]] = "mesh may not have ngskintools setup"
+
+    return failures
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    if len(args) != 3:
+        print(__doc__.strip())
+        return 1
+
+    scene, jobs_path, report_path = args
+    with open(jobs_path, "r") as f:
+        jobs = json.load(f)
+
+    import maya.standalone
+    maya.standalone.initialize()
+    try:
+        from maya import cmds
+
+        cmds.loadPlugin("ngSkinTools2", quiet=True)
+        cmds.file(scene, open=True, force=True)
+        failures = export_meshes(jobs)
+
+        with open(report_path, "w") as f:
+            json.dump({"failures": failures}, f, sort_keys=True, indent=4)
+    finally:
+        maya.standalone.uninitialize()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
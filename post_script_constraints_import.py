@@ -10,7 +10,14 @@ Constraints json file schema:
         ],
         "interp_type": 1,
         "type": "parent",
-        "target": "lips_master_null"
+        "target": "lips_master_null",
+        "maintainOffset": true,
+        "constraint_attributes": {
+            "target[0]": {
+                "targetOffsetTranslate": [0.0, 0.0, 0.0],
+                "targetOffsetRotate": [0.0, 0.0, 0.0]
+            }
+        }
     }
 ]
 """
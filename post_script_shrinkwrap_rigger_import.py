@@ -37,5 +37,10 @@ else:
 
 object_set.data.set(json.dumps(data))
 
-for rig_data in data:
-    shrinkwrap_rigger.rig_from_data(rig_data)
+# Analysis is cached next to the shrinkwraps folder.
+cache_directory = os.path.join(directory, filename, "shrinkwraps_cache")
+# Configs sharing a source mesh share its analysis. Plans are solved
+# serially: this runs inside the Maya session, where process workers would
+# need multiprocessing.set_executable pointing at mayapy, and the solve is
+# mostly skipped by the cache anyway.
+shrinkwrap_rigger.rig_many(data, cache_directory=cache_directory)
@@ -0,0 +1,341 @@
+"""
+Benchmark of the Maya independent shrinkwrap solvers on synthetic meshes.
+
+Open cylinders, eyelid like strips and lip rings are generated as plain arrays
+at increasing resolution, and border splitting, ring ordering, shortest paths,
+nearest vertex search and naming are timed on them. Peak memory per stage is
+measured with tracemalloc.
+
+Times are the median of several runs, stored relative to the median time of
+a fixed pure Python workload, so a baseline recorded on one machine is
+roughly comparable on another. Stages that took less than MINIMUM_SECONDS in
+the baseline are not judged, as their times are mostly noise.
+
+Usage:
+    python shrinkwrap_benchmark.py
+    python shrinkwrap_benchmark.py --update-baseline
+
+Exits with status 1 when a stage regressed against the baseline.
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import shrinkwrap_naming
+import shrinkwrap_paths
+import shrinkwrap_spatial
+import shrinkwrap_topology
+
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "shrinkwrap_benchmark_baseline.json"
+)
+
+# Ignore stages faster than this, and differences below these, as they are
+# mostly noise.
+MINIMUM_SECONDS = 0.005
+MINIMUM_BYTES = 64 * 1024
+
+
+def _edges_from_faces(face_vertex_counts, face_vertices):
+    """Unique edges of faces, flattened, in the order they are found."""
+    edge_vertices = []
+    found = set()
+    offset = 0
+    for count in face_vertex_counts:
+        for index in range(count):
+            a = face_vertices[offset + index]
+            b = face_vertices[offset + (index + 1) % count]
+            key = (min(a, b), max(a, b))
+            if key in found:
+                continue
+            found.add(key)
+            edge_vertices.extend(key)
+        offset += count
+
+    return edge_vertices
+
+
+def _grid(columns, rows, position, closed=False):
+    """Quad grid of columns by rows vertices.
+
+    Args:
+        columns (int): Vertices per row.
+        rows (int): Number of rows.
+        position (function): Returns a (x, y, z) tuple for a column and row.
+        closed (bool): Connect the last column back to the first.
+
+    Returns:
+        tuple: MeshTopology and (x, y, z) tuple per vertex.
+    """
+    points = []
+    for row in range(rows):
+        for column in range(columns):
+            points.append(position(column, row))
+
+    face_vertices = []
+    face_columns = columns if closed else columns - 1
+    for row in range(rows - 1):
+        for column in range(face_columns):
+            next_column = (column + 1) % columns
+            face_vertices.extend(
+                [
+                    row * columns + column,
+                    row * columns + next_column,
+                    (row + 1) * columns + next_column,
+                    (row + 1) * columns + column
+                ]
+            )
+    face_vertex_counts = [4] * (len(face_vertices) // 4)
+
+    topology = shrinkwrap_topology.MeshTopology(
+        len(points),
+        _edges_from_faces(face_vertex_counts, face_vertices),
+        face_vertex_counts,
+        face_vertices
+    )
+    return topology, points
+
+
+def cylinder(segments, rows):
+    """Open cylinder with a border at the top and the bottom."""
+    def position(column, row):
+        angle = 2.0 * math.pi * column / segments
+        return (math.cos(angle), float(row) / rows, math.sin(angle))
+
+    return _grid(segments, rows, position, closed=True)
+
+
+def eyelid_strip(columns, rows):
+    """Open arched strip with a single border, like an eyelid."""
+    def position(column, row):
+        u = float(column) / (columns - 1) * 2.0 - 1.0
+        v = float(row) / rows
+        return (u, math.cos(u * math.pi / 2.0) * 0.5 - v * 0.2, 0.2 * v)
+
+    return _grid(columns, rows, position)
+
+
+def lip_ring(segments, rows):
+    """Flat elliptic ring with an inner and outer border, like the lips."""
+    def position(column, row):
+        angle = 2.0 * math.pi * column / segments
+        radius = 1.0 + 0.5 * float(row) / rows
+        return (radius * math.cos(angle), radius * math.sin(angle) * 0.5, 0.0)
+
+    return _grid(segments, rows, position, closed=True)
+
+
+SHAPES = [
+    ("cylinder", cylinder),
+    ("eyelid_strip", eyelid_strip),
+    ("lip_ring", lip_ring)
+]
+RESOLUTIONS = [(32, 4), (128, 8), (512, 16)]
+
+
+def _calibrate():
+    """Seconds spent on a fixed pure Python workload."""
+    start = time.perf_counter()
+    values = {}
+    for index in range(200000):
+        values[index % 1000] = values.get(index % 1000, 0) + index
+    return time.perf_counter() - start
+
+
+def _measure(function, repeat):
+    """Median time over repeats and peak memory of a function.
+
+    Returns:
+        tuple: Seconds, peak bytes and the result of the function.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    seconds = statistics.median(times)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak, result
+
+
+def _stages(topology, points):
+    """Benchmark stages of a mesh as (name, function) in order.
+
+    Later stages use results of earlier ones, so they are generated lazily.
+    """
+    borders = []
+
+    def split():
+        borders[:] = shrinkwrap_topology.split_borders(topology)
+        return borders
+
+    yield "split_borders", split
+
+    def order():
+        return shrinkwrap_topology.order_ring(topology, borders[0])
+
+    yield "order_ring", order
+    ring = order()
+
+    def path():
+        # From the first ring vertex to the far side of the mesh.
+        return shrinkwrap_paths.shortest_path(
+            topology, ring[0], topology.vertex_count - 1 - len(ring) // 2
+        )
+
+    yield "shortest_path", path
+
+    def nearest():
+        tree = shrinkwrap_spatial.KDTree(points)
+        return [
+            tree.nearest((x[0] + 0.01, x[1] + 0.01, x[2] + 0.01))
+            for x in [points[index] for index in ring]
+        ]
+
+    yield "nearest_vertex", nearest
+
+    def naming():
+        return shrinkwrap_naming.plan_names([points[x] for x in ring])
+
+    yield "naming", naming
+
+
+def run(repeat=5):
+    """Run all stages on all shapes and resolutions.
+
+    Args:
+        repeat (int): Timing runs of the calibration and of each stage. The
+            median is kept.
+
+    Returns:
+        dict: Calibration seconds and results keyed by
+            "shape/resolution/stage".
+    """
+    calibration = statistics.median(_calibrate() for _ in range(repeat))
+    results = {}
+    for shape_name, shape in SHAPES:
+        for columns, rows in RESOLUTIONS:
+            topology, points = shape(columns, rows)
+            for stage_name, function in _stages(topology, points):
+                seconds, peak, _ = _measure(function, repeat)
+                key = "{0}/{1}x{2}/{3}".format(
+                    shape_name, columns, rows, stage_name
+                )
+                results[key] = {
+                    "vertices": topology.vertex_count,
+                    "seconds": seconds,
+                    "relative": seconds / calibration,
+                    "peak_bytes": peak
+                }
+
+    return {"calibration": calibration, "results": results}
+
+
+def compare(report, baseline, time_tolerance=1.0, memory_tolerance=0.25):
+    """Stages that regressed against a baseline.
+
+    Args:
+        report (dict): Result of run.
+        baseline (dict): Earlier result of run.
+        time_tolerance (float): Allowed relative slowdown.
+        memory_tolerance (float): Allowed relative peak memory growth.
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+    for key, result in sorted(report["results"].items()):
+        if key not in baseline["results"]:
+            continue
+        expected = baseline["results"][key]
+
+        limit = expected["relative"] * (1.0 + time_tolerance)
+        excess = (result["relative"] - limit) * report["calibration"]
+        judged = expected["seconds"] >= MINIMUM_SECONDS
+        if judged and result["relative"] > limit and excess > MINIMUM_SECONDS:
+            regressions.append(
+                "{0}: time {1:.2f}x the baseline".format(
+                    key, result["relative"] / expected["relative"]
+                )
+            )
+
+        limit = expected["peak_bytes"] * (1.0 + memory_tolerance)
+        excess = result["peak_bytes"] - limit
+        if excess > MINIMUM_BYTES:
+            regressions.append(
+                "{0}: peak memory {1} bytes, baseline {2} bytes".format(
+                    key, result["peak_bytes"], expected["peak_bytes"]
+                )
+            )
+
+    return regressions
+
+
+def _print_report(report):
+    print("Calibration: {0:.4f}s".format(report["calibration"]))
+    for key, result in report["results"].items():
+        print(
+            "{0:<45} {1:>7} verts {2:>9.4f}s {3:>10.1f} KiB".format(
+                key,
+                result["vertices"],
+                result["seconds"],
+                result["peak_bytes"] / 1024.0
+            )
+        )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the new baseline."
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--time-tolerance", type=float, default=1.0)
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    args = parser.parse_args(args)
+
+    report = run(args.repeat)
+    _print_report(report)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, sort_keys=True, indent=4)
+        print("Baseline stored in {0}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found at {0}".format(args.baseline))
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+
+    regressions = compare(
+        report, baseline, args.time_tolerance, args.memory_tolerance
+    )
+    for regression in regressions:
+        print("Regression: {0}".format(regression))
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Persistent on-disk cache of shrinkwrap rig plans.
+
+Plans are keyed by a fingerprint of the topology, points and UVs of the
+meshes involved plus the rig configuration, so any change to the meshes or the
+configuration misses the cache. The least recently used plans are evicted
+once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import struct
+
+import shrinkwrap_plan
+
+
+def _pack_doubles(values, precision):
+    # Adding zero turns negative zero into zero.
+    values = [round(value, precision) + 0.0 for value in values]
+    return struct.pack("<%dd" % len(values), *values)
+
+
+def fingerprint_data(face_vertex_counts,
+                     face_vertices,
+                     points,
+                     precision=6,
+                     uv_set="",
+                     uv_counts=(),
+                     uv_ids=(),
+                     us=(),
+                     vs=()):
+    """Fingerprint of mesh topology, points and UVs.
+
+    Args:
+        face_vertex_counts (list): Number of vertices per face.
+        face_vertices (list): Vertex indices per face, flattened.
+        points (list): (x, y, z) tuple per vertex.
+        precision (int): Decimals the points and UVs are rounded to.
+        uv_set (str): Name of the UV set.
+        uv_counts (list): Number of assigned UVs per face.
+        uv_ids (list): UV index per face vertex, for faces with UVs.
+        us (list): U value per UV index.
+        vs (list): V value per UV index.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha1()
+    digest.update(struct.pack("<i", len(points)))
+    digest.update(
+        struct.pack("<%di" % len(face_vertex_counts), *face_vertex_counts)
+    )
+    digest.update(struct.pack("<%di" % len(face_vertices), *face_vertices))
+
+    values = [value for point in points for value in point]
+    digest.update(_pack_doubles(values, precision))
+
+    # Plans store UVs, so edited UVs have to miss the cache.
+    digest.update(uv_set.encode("utf-8"))
+    digest.update(struct.pack("<i", len(uv_counts)))
+    digest.update(struct.pack("<%di" % len(uv_counts), *uv_counts))
+    digest.update(struct.pack("<%di" % len(uv_ids), *uv_ids))
+    digest.update(struct.pack("<i", len(us)))
+    digest.update(_pack_doubles(us, precision))
+    digest.update(_pack_doubles(vs, precision))
+
+    return digest.hexdigest()
+
+
+def mesh_fingerprint(mesh):
+    """Fingerprint of the topology, world positions and UVs of a mesh.
+
+    Args:
+        mesh (str or PyNode): Mesh transform or shape.
+
+    Returns:
+        str: Hex digest.
+    """
+    from maya.api import OpenMaya
+
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(mesh))
+    dag_path = selection.getDagPath(0)
+    dag_path.extendToShape()
+    fn_mesh = OpenMaya.MFnMesh(dag_path)
+
+    face_vertex_counts, face_vertices = fn_mesh.getVertices()
+    points = fn_mesh.getPoints(OpenMaya.MSpace.kWorld)
+    us, vs = fn_mesh.getUVs()
+    uv_counts, uv_ids = fn_mesh.getAssignedUVs()
+    return fingerprint_data(
+        list(face_vertex_counts),
+        list(face_vertices),
+        [(point.x, point.y, point.z) for point in points],
+        uv_set=fn_mesh.currentUVSetName(),
+        uv_counts=list(uv_counts),
+        uv_ids=list(uv_ids),
+        us=list(us),
+        vs=list(vs)
+    )
+
+
+class PlanCache(object):
+    """Directory of json plans keyed by fingerprint.
+
+    Args:
+        directory (str): Directory to store the plans in.
+        max_size (int): Maximum size in bytes of all plans together.
+    """
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, fingerprints, settings):
+        """Cache key for mesh fingerprints and rig settings."""
+        digest = hashlib.sha1()
+        digest.update(str(shrinkwrap_plan.PLAN_VERSION).encode("utf-8"))
+        for fingerprint in fingerprints:
+            digest.update(fingerprint.encode("utf-8"))
+        digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, "{}.json".format(key))
+
+    def get(self, key):
+        """Cached plan for a key, or None when it is missing or invalid."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            plan = shrinkwrap_plan.load_plan(path)
+        except ValueError:
+            plan = None
+
+        if plan is None or plan.get("cache_key") != key:
+            os.remove(path)
+            return None
+
+        # Mark as recently used.
+        os.utime(path, None)
+        return plan
+
+    def put(self, key, plan):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        plan = dict(plan)
+        plan["cache_key"] = key
+        shrinkwrap_plan.save_plan(plan, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used plans until under max_size."""
+        if not os.path.exists(self.directory):
+            return
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total = sum(entry[1] for entry in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        if not os.path.exists(self.directory):
+            return
+
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
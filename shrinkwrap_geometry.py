@@ -0,0 +1,224 @@
+"""
+Maya independent geometry solvers for the shrinkwrap rigger.
+
+Everything works on whole arrays of points and normals at once, so the scene
+is only read in bulk before and written to after solving.
+"""
+
+import math
+
+
+def _add(a, b):
+    return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+
+def _scale(a, value):
+    return (a[0] * value, a[1] * value, a[2] * value)
+
+
+def _cross(a, b):
+    return (
+        a[1] * b[2] - a[2] * b[1],
+        a[2] * b[0] - a[0] * b[2],
+        a[0] * b[1] - a[1] * b[0]
+    )
+
+
+def _normalize(a):
+    length = math.sqrt(a[0] * a[0] + a[1] * a[1] + a[2] * a[2])
+    if not length:
+        return a
+    return (a[0] / length, a[1] / length, a[2] / length)
+
+
+def points_from_mesh(mesh, space="world"):
+    """Read all vertex positions of a mesh in one call.
+
+    Args:
+        mesh (str or PyNode): Mesh transform or shape.
+        space (str): "world" or "object".
+
+    Returns:
+        list: (x, y, z) tuple per vertex.
+    """
+    from maya.api import OpenMaya
+
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(mesh))
+    dag_path = selection.getDagPath(0)
+    dag_path.extendToShape()
+
+    spaces = {
+        "world": OpenMaya.MSpace.kWorld,
+        "object": OpenMaya.MSpace.kObject
+    }
+    points = OpenMaya.MFnMesh(dag_path).getPoints(spaces[space])
+    return [(point.x, point.y, point.z) for point in points]
+
+
+def face_normals(topology, points):
+    """Normal of every face, using Newell's method.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        points (list): (x, y, z) tuple per vertex.
+
+    Returns:
+        list: Normalized (x, y, z) tuple per face.
+    """
+    results = []
+    for face in range(topology.face_count):
+        verts = topology.face_verts(face)
+        x = y = z = 0.0
+        for index, vert in enumerate(verts):
+            a = points[vert]
+            b = points[verts[(index + 1) % len(verts)]]
+            x += (a[1] - b[1]) * (a[2] + b[2])
+            y += (a[2] - b[2]) * (a[0] + b[0])
+            z += (a[0] - b[0]) * (a[1] + b[1])
+        results.append(_normalize((x, y, z)))
+
+    return results
+
+
+def edge_frames(topology,
+                points,
+                normals,
+                edges,
+                up_vector_positions=None,
+                up_vector_highest=False):
+    """Joint frames for edges, solved in one pass.
+
+    The frame sits at the edge midpoint, with the z axis along the averaged
+    normal of the connected faces and the y axis pointing towards the up
+    vector position.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        points (list): (x, y, z) tuple per vertex.
+        normals (list): (x, y, z) tuple per face.
+        edges (list): Edge indices to solve.
+        up_vector_positions (list): Up vector position per edge. Ignored
+            when up_vector_highest is True.
+        up_vector_highest (bool): Point the up vector to the highest vertex
+            of each edge.
+
+    Returns:
+        list: 4x4 matrix as nested lists per edge.
+    """
+    results = []
+    for count, edge in enumerate(edges):
+        verts = topology.edge_verts(edge)
+        position = _scale(_add(points[verts[0]], points[verts[1]]), 0.5)
+
+        # Average normal.
+        faces = topology.edge_faces_of(edge)
+        normals_sum = (0.0, 0.0, 0.0)
+        for face in faces:
+            normals_sum = _add(normals_sum, normals[face])
+        x_vector = _scale(normals_sum, 1.0 / len(faces))
+
+        if up_vector_highest:
+            up_vector_position = points[verts[0]]
+            for vert in verts:
+                if points[vert][1] >= up_vector_position[1]:
+                    up_vector_position = points[vert]
+        else:
+            up_vector_position = up_vector_positions[count]
+        up_vector = _sub(up_vector_position, position)
+
+        z_vector = _normalize(_cross(x_vector, up_vector))
+        y_vector = _normalize(_cross(z_vector, x_vector))
+        x_vector = _normalize(x_vector)
+
+        results.append(
+            [
+                [-z_vector[0], -z_vector[1], -z_vector[2], 0.0],
+                [y_vector[0], y_vector[1], y_vector[2], 0.0],
+                [x_vector[0], x_vector[1], x_vector[2], 0.0],
+                [position[0], position[1], position[2], 1.0]
+            ]
+        )
+
+    return results
+
+
+def matrix_to_euler(matrix):
+    """Rotation of an orthonormal matrix as xyz euler angles in degrees.
+
+    Args:
+        matrix (list): 4x4 or 3x3 matrix as nested lists, row vectors.
+
+    Returns:
+        list: Rotation in degrees.
+    """
+    sin_y = max(-1.0, min(1.0, -matrix[0][2]))
+    y = math.asin(sin_y)
+    if abs(math.cos(y)) > 1e-9:
+        x = math.atan2(matrix[1][2], matrix[2][2])
+        z = math.atan2(matrix[0][1], matrix[0][0])
+    else:
+        # Gimbal lock, so all rotation is put in x.
+        x = math.atan2(-matrix[2][1], matrix[1][1])
+        z = 0.0
+
+    return [math.degrees(x), math.degrees(y), math.degrees(z)]
+
+
+def vertex_uvs(topology, uv_counts, uv_ids, us, vs):
+    """UV of every vertex, taken from the first face using the vertex.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        uv_counts (list): Number of assigned UVs per face.
+        uv_ids (list): UV index per face vertex, for faces with UVs.
+        us (list): U value per UV index.
+        vs (list): V value per UV index.
+
+    Returns:
+        list: (u, v) tuple per vertex, or None for vertices without UVs.
+    """
+    uvs = [None] * topology.vertex_count
+    uv_index = 0
+    for face in range(topology.face_count):
+        count = uv_counts[face]
+        if count != topology.face_vertex_counts[face]:
+            uv_index += count
+            continue
+
+        for vertex in topology.face_verts(face):
+            if uvs[vertex] is None:
+                uv = uv_ids[uv_index]
+                uvs[vertex] = (us[uv], vs[uv])
+            uv_index += 1
+
+    return uvs
+
+
+def vertex_uvs_from_mesh(mesh, topology):
+    """UV of every vertex of a mesh, read in bulk from the current UV set.
+
+    Args:
+        mesh (str or PyNode): Mesh transform or shape.
+        topology (MeshTopology): Topology of the mesh.
+
+    Returns:
+        list: (u, v) tuple per vertex, or None for vertices without UVs.
+    """
+    from maya.api import OpenMaya
+
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(mesh))
+    dag_path = selection.getDagPath(0)
+    dag_path.extendToShape()
+    fn_mesh = OpenMaya.MFnMesh(dag_path)
+
+    us, vs = fn_mesh.getUVs()
+    uv_counts, uv_ids = fn_mesh.getAssignedUVs()
+    return vertex_uvs(
+        topology, list(uv_counts), list(uv_ids), list(us), list(vs)
+    )
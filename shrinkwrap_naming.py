@@ -0,0 +1,80 @@
+"""
+Maya independent symmetric naming by position.
+
+Positions at the same height within a tolerance are paired up as Rt/Lt by
+their x value, and anything left over is named as center C.
+"""
+
+
+def plan_names(positions, tolerance=0.001, prefix="", suffix=""):
+    """Plan names for positions without touching the scene.
+
+    Every position is paired with each position below it within tolerance,
+    and keeps the name of its last pair. Positions are sorted top to bottom,
+    and the last pair of each position follows from the bounds of its
+    tolerance window in one sweep, so naming is O(n log n) however many
+    positions share a height.
+
+    Args:
+        positions (list): (x, y) or (x, y, z) per node.
+        tolerance (float): Maximum height difference of a pair.
+        prefix (str): Prefix for all names.
+        suffix (str): Suffix for all names.
+
+    Returns:
+        list: Tuples of position index and name, in the order the names
+            should be applied.
+    """
+    # Sort by y axis, top to bottom
+    order = sorted(range(len(positions)), key=lambda x: positions[x][1])
+    order.reverse()
+
+    # Window of every sorted position: the positions after it, up to but
+    # excluding ends[i], are within tolerance below it. Windows end in order,
+    # so one sweep finds them all.
+    ends = []
+    end = 0
+    for count, a in enumerate(order):
+        end = max(end, count + 1)
+        while (end < len(order) and
+               positions[a][1] - positions[order[end]][1] <= tolerance):
+            end += 1
+        ends.append(end)
+
+    # Pairs are numbered in sweep order, so the pairs of a window start
+    # after the pairs of all windows above it.
+    starts = []
+    pair_count = 0
+    for count, end in enumerate(ends):
+        starts.append(pair_count)
+        pair_count += end - count - 1
+
+    # The last pair of a position is the last one in its own window, or
+    # otherwise the one with the position above it.
+    names = {}
+    for count, a in enumerate(order):
+        if ends[count] > count + 1:
+            first, second = count, ends[count] - 1
+        elif count and ends[count - 1] > count:
+            first, second = count - 1, count
+        else:
+            continue
+
+        pair_index = starts[first] + second - first
+        pair = [order[first], order[second]]
+        # Sort pairs by x value.
+        pair.sort(key=lambda x: positions[x][0])
+        side = "Rt" if pair[0] == a else "Lt"
+        names[a] = "{0}{1:0>2}".format(side, pair_index)
+
+    # Non positional pairs will be center "C"
+    results = []
+    center_count = 1
+    for index in order:
+        if index not in names:
+            names[index] = "{0}{1:0>2}".format("C", center_count)
+            center_count += 1
+
+        results.append((index, prefix + names[index] + suffix))
+
+    return results
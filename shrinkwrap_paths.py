@@ -0,0 +1,134 @@
+"""
+Maya independent shortest paths on mesh topology.
+
+Paths are found with breadth first searches over the cached edge adjacency of
+a MeshTopology, so they count edges like polySelect's shortestEdgePath without
+changing the selection.
+"""
+
+from collections import deque
+
+
+def breadth_first(topology, sources, targets=None):
+    """Breadth first search from one or more sources.
+
+    With several sources every vertex is claimed by its nearest source, which
+    makes this a multi source search.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        sources (list): Vertex indices to start from.
+        targets (set): Stop once the nearest layer of these vertices is
+            reached. Searches the whole mesh when None.
+
+    Returns:
+        tuple: Dictionaries of vertex to distance, vertex to the edge it was
+            reached through and vertex to the source it was reached from.
+    """
+    distances = {}
+    parent_edges = {}
+    origins = {}
+    queue = deque()
+    for source in sources:
+        if source in distances:
+            continue
+        distances[source] = 0
+        parent_edges[source] = None
+        origins[source] = source
+        queue.append(source)
+
+    stop_distance = None
+    while queue:
+        vertex = queue.popleft()
+        distance = distances[vertex]
+        if stop_distance is not None and distance >= stop_distance:
+            break
+
+        for edge in topology.vertex_edges_of(vertex):
+            other = topology.other_vertex(edge, vertex)
+            if other in distances:
+                continue
+
+            distances[other] = distance + 1
+            parent_edges[other] = edge
+            origins[other] = origins[vertex]
+            queue.append(other)
+
+            if targets is not None and other in targets:
+                stop_distance = distance + 1
+
+    return distances, parent_edges, origins
+
+
+def trace_path(topology, parent_edges, vertex):
+    """Walk parent edges back from a vertex to its source.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        parent_edges (dict): Vertex to the edge it was reached through.
+        vertex (int): Vertex index to trace from.
+
+    Returns:
+        tuple: Vertex indices and edge indices from the source to the vertex.
+    """
+    vertices = [vertex]
+    edges = []
+    while parent_edges[vertices[-1]] is not None:
+        edge = parent_edges[vertices[-1]]
+        edges.append(edge)
+        vertices.append(topology.other_vertex(edge, vertices[-1]))
+
+    vertices.reverse()
+    edges.reverse()
+    return vertices, edges
+
+
+def shortest_path(topology, source, target):
+    """Shortest edge path between two vertices.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        source (int): Vertex index to start from.
+        target (int): Vertex index to end at.
+
+    Returns:
+        tuple: Vertex indices and edge indices along the path. Both are empty
+            when the target can not be reached.
+    """
+    distances, parent_edges, _ = breadth_first(
+        topology, [source], targets=set([target])
+    )
+    if target not in distances:
+        return [], []
+
+    return trace_path(topology, parent_edges, target)
+
+
+def nearest_paths(topology, source, targets):
+    """Shortest edge paths to every target at the smallest distance.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        source (int): Vertex index to start from.
+        targets (list): Vertex indices to look for. The source is ignored.
+
+    Returns:
+        list: Tuples of vertex indices and edge indices, one per nearest
+            target.
+    """
+    targets = set(targets)
+    targets.discard(source)
+    distances, parent_edges, _ = breadth_first(
+        topology, [source], targets=targets
+    )
+
+    reached = [x for x in targets if x in distances]
+    if not reached:
+        return []
+
+    shortest = min(distances[x] for x in reached)
+    return [
+        trace_path(topology, parent_edges, x)
+        for x in sorted(reached)
+        if distances[x] == shortest
+    ]
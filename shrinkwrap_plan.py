@@ -0,0 +1,491 @@
+"""
+Maya independent planning of a shrinkwrap rig.
+
+A plan is a plain data structure holding everything needed to build the rig;
+joint matrices, control transforms, hierarchy, constraint targets and weights,
+skin weights and names. It serializes to json, so an unchanged configuration
+on an unchanged mesh can be rebuilt without redoing the analysis.
+
+Plan schema:
+{
+    "version": 2,
+    "settings": {"prefix": "lips", "mesh": "lips_geo", ...},
+    "ordered_vertices": [12, 13, ...],
+    "ordered_edges": [40, 41, ...],
+    "middle_vertices": [120, 124, ...],
+    "joints": [{"name": "lips_shrinkwrap00_jnt", "matrix": [[...], ...]}],
+    "skin_weights": [[vertex, joint index, weight], ...],
+    "master": {
+        "group": "lips_master_grp",
+        "null": "lips_master_null",
+        "control": "lips_master_ctrl",
+        "position": [x, y, z],
+        "points": [[x, y, z], ...]
+    },
+    "controls": [
+        {
+            "name": "lips_main00_ctrl",
+            "group": "lips_main00_grp",
+            "null": "lips_main00_null",
+            "icon": "cube",
+            "color": [1, 0, 0],
+            "matrix": [[...], ...],
+            "joint": 0,
+            "parents": [[control index, weight], ...]
+        }
+    ],
+    "pop": {
+        "control_size": 0.5,
+        "control_offset": 0.0,
+        "vertices": [
+            {
+                "vertex": 120,
+                "look_at_vertex": 121,
+                "uv": [0.25, 0.5],
+                "look_at_uv": [0.25, 0.55],
+                "names": {"normal": "lips_normal00_grp", ...}
+            }
+        ]
+    }
+}
+"""
+
+import json
+
+import control_hierarchy
+import shrinkwrap_geometry
+import shrinkwrap_paths
+import shrinkwrap_profiler
+import shrinkwrap_spatial
+import shrinkwrap_subdivision
+import shrinkwrap_topology
+
+
+PLAN_VERSION = 2
+
+# Configuration keys that go into a plan.
+SETTINGS = [
+    "mesh",
+    "shrinkwrap_mesh",
+    "main_control_start",
+    "main_control_frequency",
+    "up_vector_highest",
+    "flip_direction",
+    "prefix",
+    "control_size",
+    "control_offset",
+    "mesh_divisions"
+]
+
+
+class Cancelled(Exception):
+    """Raised to stop planning or building a rig part way."""
+
+
+def _report(progress, fraction, message):
+    if progress is not None:
+        progress(fraction, message)
+
+
+def _bounding_box_center(points):
+    return [
+        (min(x[axis] for x in points) + max(x[axis] for x in points)) / 2.0
+        for axis in range(3)
+    ]
+
+
+def _offset_position(matrix, offset):
+    """Position moved along the local z axis of a matrix."""
+    return [matrix[3][axis] + matrix[2][axis] * offset for axis in range(3)]
+
+
+def build_plan(topology,
+               points,
+               smooth_topology,
+               smooth_points,
+               smooth_uvs=None,
+               mesh=None,
+               shrinkwrap_mesh=None,
+               main_control_start=0,
+               main_control_frequency=1,
+               up_vector_highest=False,
+               flip_direction=False,
+               prefix="shrinkwrap_rig",
+               control_size=1.0,
+               control_offset=0.0,
+               mesh_divisions=1,
+               progress=None):
+    """Plan a shrinkwrap rig from mesh data.
+
+    Args:
+        topology (MeshTopology): Topology of the mesh.
+        points (list): World positions of the mesh.
+        smooth_topology (MeshTopology): Topology of the mesh after smoothing.
+        smooth_points (list): World positions of the smoothed mesh, after
+            shrinkwrapping.
+        smooth_uvs (list): UV per vertex of the smoothed mesh, for attaching
+            the point on poly controls.
+        progress (function): Called with the fraction done and a message
+            before each step. It can raise Cancelled to stop planning.
+
+    Returns:
+        dict: Rig plan.
+
+    Raises:
+        ValueError: When a point on poly control lands on a vertex without
+            UVs.
+    """
+    settings = {
+        "mesh": mesh,
+        "shrinkwrap_mesh": shrinkwrap_mesh,
+        "main_control_start": main_control_start,
+        "main_control_frequency": main_control_frequency,
+        "up_vector_highest": up_vector_highest,
+        "flip_direction": flip_direction,
+        "prefix": prefix,
+        "control_size": control_size,
+        "control_offset": control_offset,
+        "mesh_divisions": mesh_divisions
+    }
+
+    (
+        border_edge_indices,
+        ordered_vert_indices,
+        ordered_edge_indices,
+        matrices
+    ) = solve_ring(
+        topology,
+        points,
+        main_control_start,
+        up_vector_highest,
+        flip_direction,
+        progress
+    )
+
+    # Joints.
+    joints = []
+    for index, matrix in enumerate(matrices):
+        joints.append(
+            {
+                "name": "{0}_shrinkwrap{1:0>2}_jnt".format(prefix, index),
+                "matrix": matrix
+            }
+        )
+
+    # Skin weights. One connected_edge per joint.
+    _report(progress, 3 / 8.0, "Solving skin weights")
+    with shrinkwrap_profiler.stage("skin_weights"):
+        skin_weights = []
+        weights = shrinkwrap_topology.edge_weights(
+            topology, ordered_edge_indices, range(len(joints))
+        )
+        for vertex in sorted(weights):
+            for joint_index in sorted(weights[vertex]):
+                skin_weights.append(
+                    [vertex, joint_index, weights[vertex][joint_index]]
+                )
+
+    # Master control
+    _report(progress, 4 / 8.0, "Planning controls")
+    with shrinkwrap_profiler.stage("controls"):
+        master = {
+            "group": "{0}_master_grp".format(prefix),
+            "null": "{0}_master_null".format(prefix),
+            "control": "{0}_master_ctrl".format(prefix),
+            "position": _bounding_box_center(
+                [points[vert] for vert in ordered_vert_indices]
+            ),
+            "points": [
+                _offset_position(matrix, control_offset) for matrix in matrices
+            ]
+        }
+
+        # Create controls with parent and children. Relationship is
+        # determined by skipping edges in the ring. Starting point is
+        # configurable. Child controls are blended between the surrounding
+        # parent controls.
+        hierarchy = control_hierarchy.RingHierarchy(
+            len(joints), main_control_frequency
+        )
+        controls = []
+        for data in hierarchy.controls(prefix):
+            joint_index = data.pop("index")
+            if hierarchy.is_main(joint_index):
+                data["icon"] = "cube"
+                data["color"] = [1, 0, 0]
+            else:
+                data["icon"] = "sphere"
+                data["color"] = [0, 1, 0]
+            data["matrix"] = matrices[joint_index]
+            data["joint"] = joint_index
+            controls.append(data)
+
+    subdivision = shrinkwrap_subdivision.SubdivisionMap(
+        topology, smooth_topology, mesh_divisions
+    )
+
+    # Getting edge loop verts. The middle vert of each connecting edge after
+    # smoothing, and the verts between them.
+    _report(progress, 5 / 8.0, "Finding middle loop")
+    with shrinkwrap_profiler.stage("middle_paths"):
+        middle_vert_indices = [
+            subdivision.edge_midpoint(edge) for edge in ordered_edge_indices
+        ]
+
+        loop_vert_indices = set()
+        for count in range(0, len(middle_vert_indices)):
+            loop_vert_indices.update(
+                subdivision.path(
+                    middle_vert_indices[count - 1],
+                    middle_vert_indices[count]
+                )
+            )
+        loop_vert_indices = sorted(loop_vert_indices)
+
+    # Get look at verts. The paths from each border vert to its nearest
+    # border verts, which are the border verts sharing an edge with it.
+    _report(progress, 6 / 8.0, "Finding look at vertices")
+    with shrinkwrap_profiler.stage("look_at_vertices"):
+        border_vert_indices = shrinkwrap_topology.unique_edge_vertices(
+            topology, border_edge_indices
+        )
+        look_at_border_indices = set()
+        if subdivision.valid:
+            border_vert_set = set(border_vert_indices)
+            for vert in border_vert_indices:
+                for connected_vert in topology.connected_vertices(vert):
+                    if connected_vert in border_vert_set:
+                        look_at_border_indices.update(
+                            subdivision.path(vert, connected_vert)
+                        )
+        else:
+            for vert in border_vert_indices:
+                for path, _ in shrinkwrap_paths.nearest_paths(
+                    smooth_topology, vert, border_vert_indices
+                ):
+                    look_at_border_indices.update(path)
+
+        # Closest border vert to each loop vert, and then the vert connected to
+        # the loop vert that is closest to that border vert.
+        border_vert_indices = sorted(look_at_border_indices)
+        border_tree = shrinkwrap_spatial.KDTree(
+            [smooth_points[index] for index in border_vert_indices]
+        )
+        middle_vert_set = set(middle_vert_indices)
+        look_at_vert_indices = set()
+        for middle_vert in loop_vert_indices:
+            closest_border_vert = border_vert_indices[
+                border_tree.nearest(smooth_points[middle_vert])
+            ]
+
+            connected_verts = [
+                vert
+                for vert in sorted(
+                    smooth_topology.connected_vertices(middle_vert)
+                )
+                if vert not in middle_vert_set
+            ]
+            closest = shrinkwrap_spatial.closest_point(
+                smooth_points[closest_border_vert],
+                [smooth_points[vert] for vert in connected_verts]
+            )
+            if closest is not None:
+                look_at_vert_indices.add(connected_verts[closest])
+
+    _report(progress, 7 / 8.0, "Planning point on poly controls")
+    return {
+        "version": PLAN_VERSION,
+        "settings": settings,
+        "ordered_vertices": ordered_vert_indices,
+        "ordered_edges": ordered_edge_indices,
+        "middle_vertices": middle_vert_indices,
+        "joints": joints,
+        "skin_weights": skin_weights,
+        "master": master,
+        "controls": controls,
+        "pop": _pop_data(
+            smooth_topology,
+            smooth_uvs,
+            loop_vert_indices,
+            look_at_vert_indices,
+            prefix,
+            control_size / 2.0,
+            control_offset,
+            mesh
+        )
+    }
+
+
+def solve_ring(topology,
+               points,
+               main_control_start=0,
+               up_vector_highest=False,
+               flip_direction=False,
+               progress=None):
+    """Order the ring of connecting edges and solve a joint frame per edge.
+
+    Only needs the source mesh, so it is cheap compared to the full plan.
+
+    Returns:
+        tuple: Border edge indices, ordered ring vertex indices, ordered
+            connecting edge indices and a matrix per connecting edge.
+    """
+    # Split boundary edges into borders. The first border is the one with the
+    # lowest edge index, the remaining borders make up the other side.
+    _report(progress, 0 / 8.0, "Splitting borders")
+    with shrinkwrap_profiler.stage("split_borders"):
+        borders = shrinkwrap_topology.split_borders(topology)
+        border_edge_indices = sorted(
+            [edge for border in borders[1:] for edge in border]
+        )
+        if flip_direction:
+            border_edge_indices = borders[0]
+
+    # Order boundary verts by connection.
+    _report(progress, 1 / 8.0, "Ordering ring")
+    with shrinkwrap_profiler.stage("order_ring"):
+        ordered_vert_indices = shrinkwrap_topology.order_ring(
+            topology, border_edge_indices
+        )
+
+        # Order connecting edges by ordered boundary verts.
+        ordered_edge_indices = shrinkwrap_topology.ring_connecting_edges(
+            topology, ordered_vert_indices
+        )
+        ordered_edge_indices = (
+            ordered_edge_indices[main_control_start:] +
+            ordered_edge_indices[:main_control_start]
+        )
+
+    # Joints.
+    _report(progress, 2 / 8.0, "Solving joints")
+    with shrinkwrap_profiler.stage("joint_frames"):
+        normals = shrinkwrap_geometry.face_normals(topology, points)
+        ring_verts = set(ordered_vert_indices)
+        up_vector_positions = []
+        for edge in ordered_edge_indices:
+            up_vector_position = None
+            for vert in topology.edge_verts(edge):
+                if vert in ring_verts:
+                    up_vector_position = points[vert]
+                    break
+            up_vector_positions.append(up_vector_position)
+
+        matrices = shrinkwrap_geometry.edge_frames(
+            topology,
+            points,
+            normals,
+            ordered_edge_indices,
+            up_vector_positions,
+            up_vector_highest
+        )
+
+    return (
+        border_edge_indices,
+        ordered_vert_indices,
+        ordered_edge_indices,
+        matrices
+    )
+
+
+def preview_positions(matrices,
+                      main_control_start=0,
+                      main_control_frequency=1,
+                      control_offset=0.0):
+    """Control positions for previewing a rig without planning it again.
+
+    Args:
+        matrices (list): Joint matrices from solve_ring, solved with a
+            main_control_start of zero.
+
+    Returns:
+        tuple: Position of every control in ring order, and the indices of
+            the main controls within them.
+    """
+    matrices = (
+        matrices[main_control_start:] + matrices[:main_control_start]
+    )
+    positions = [
+        _offset_position(matrix, control_offset) for matrix in matrices
+    ]
+    hierarchy = control_hierarchy.RingHierarchy(
+        len(matrices), main_control_frequency
+    )
+    return positions, hierarchy.main_indices
+
+
+def _pop_data(topology,
+              uvs,
+              verts,
+              look_at_verts,
+              prefix,
+              control_size,
+              control_offset,
+              mesh=None):
+    """Point on poly controls along the middle loop.
+
+    Raises:
+        ValueError: When UVs are given, but a vertex the controls attach to
+            has none.
+    """
+    # Order verts by connection.
+    adjacency = shrinkwrap_topology.vertex_adjacency(topology, vertices=verts)
+    ordered_verts, _ = shrinkwrap_topology.walk_loop(adjacency, verts[0])
+
+    vertices = []
+    for index, vert in enumerate(ordered_verts):
+        look_at_vert = None
+        for connected_vert in topology.connected_vertices(vert):
+            if connected_vert in look_at_verts:
+                look_at_vert = connected_vert
+
+        names = {}
+        for key in ["normal", "up_vector", "look_at", "transform", "parent"]:
+            names[key] = "{0}_{1}{2:0>2}_grp".format(prefix, key, index)
+        names["control"] = "{0}_pop{1:0>2}_ctrl".format(prefix, index)
+        names["joint"] = "{0}_pop{1:0>2}_jnt".format(prefix, index)
+
+        data = {
+            "vertex": vert,
+            "look_at_vertex": look_at_vert,
+            "uv": None,
+            "look_at_uv": None,
+            "names": names
+        }
+        if uvs is not None:
+            # Fail while planning rather than halfway through building.
+            for key, uv_vert in [("uv", vert), ("look_at_uv", look_at_vert)]:
+                if uv_vert is None:
+                    continue
+                if uvs[uv_vert] is None:
+                    raise ValueError(
+                        "Mesh \"{0}\" has no UVs at vertex {1} of the "
+                        "smoothed mesh, which point on poly control {2} "
+                        "attaches to. Assign UVs to the mesh.".format(
+                            mesh, uv_vert, names["control"]
+                        )
+                    )
+                data[key] = uvs[uv_vert]
+        vertices.append(data)
+
+    return {
+        "control_size": control_size,
+        "control_offset": control_offset,
+        "vertices": vertices
+    }
+
+
+def save_plan(plan, path):
+    with open(path, "w") as f:
+        json.dump(plan, f, sort_keys=True, indent=4)
+
+
+def load_plan(path):
+    """Load a plan, or None when the file is from another plan version."""
+    with open(path, "r") as f:
+        plan = json.load(f)
+
+    if plan.get("version") != PLAN_VERSION:
+        return None
+
+    return plan
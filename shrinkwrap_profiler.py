@@ -0,0 +1,238 @@
+"""
+Optional per stage profiling of shrinkwrap builds.
+
+Code marks its stages with the stage context manager. Nothing is recorded
+unless a profile is active, in which case every stage records its wall time,
+the number of scene commands issued and the number of nodes created. Stages
+can nest, and run on any thread.
+
+    with shrinkwrap_profiler.profile("/tmp/profiles", "lips") as profiler:
+        with shrinkwrap_profiler.stage("plan"):
+            ...
+
+The profile is written as a json report with totals per stage name, and as a
+Chrome trace that can be opened in chrome://tracing or Perfetto.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+_active = None
+
+
+class _NullStage(object):
+    """Shared do nothing context manager, for when profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.commands = self.profiler.commands
+        self.nodes = self.profiler.nodes
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        self.profiler.record(
+            self.name,
+            self.start,
+            end,
+            self.profiler.commands - self.commands,
+            self.profiler.nodes - self.nodes,
+            self.args
+        )
+        return False
+
+
+class Profiler(object):
+    """Collects stage events and counts scene commands and created nodes.
+
+    The counters come from Maya callbacks, so outside of Maya they stay at
+    zero and only the times are recorded.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.commands = 0
+        self.nodes = 0
+        self.origin = time.perf_counter()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _command_added(self, *args):
+        self.commands += 1
+
+    def _node_added(self, *args):
+        self.nodes += 1
+
+    def start(self):
+        try:
+            from maya.api import OpenMaya
+        except ImportError:
+            return
+
+        self._callbacks = [
+            OpenMaya.MCommandMessage.addCommandCallback(self._command_added),
+            OpenMaya.MDGMessage.addNodeAddedCallback(self._node_added)
+        ]
+
+    def stop(self):
+        if not self._callbacks:
+            return
+
+        from maya.api import OpenMaya
+
+        for callback in self._callbacks:
+            OpenMaya.MMessage.removeCallback(callback)
+        self._callbacks = []
+
+    def stage(self, name, args=None):
+        return _Stage(self, name, args)
+
+    def record(self, name, start, end, commands, nodes, args=None):
+        event = {
+            "name": name,
+            "start": start - self.origin,
+            "seconds": end - start,
+            "commands": commands,
+            "nodes": nodes,
+            "thread": threading.current_thread().ident
+        }
+        if args:
+            event["args"] = args
+
+        with self._lock:
+            self.events.append(event)
+
+    def report(self):
+        """Totals per stage name, in order of first appearance.
+
+        Returns:
+            dict: Total seconds, commands and nodes, and the stages.
+        """
+        stages = {}
+        order = []
+        for event in sorted(self.events, key=lambda x: x["start"]):
+            if event["name"] not in stages:
+                order.append(event["name"])
+                stages[event["name"]] = {
+                    "name": event["name"],
+                    "count": 0,
+                    "seconds": 0.0,
+                    "commands": 0,
+                    "nodes": 0
+                }
+            totals = stages[event["name"]]
+            totals["count"] += 1
+            totals["seconds"] += event["seconds"]
+            totals["commands"] += event["commands"]
+            totals["nodes"] += event["nodes"]
+
+        return {
+            "seconds": time.perf_counter() - self.origin,
+            "commands": self.commands,
+            "nodes": self.nodes,
+            "stages": [stages[name] for name in order]
+        }
+
+    def chrome_trace(self):
+        """Events in the Chrome trace event format."""
+        pid = os.getpid()
+        events = []
+        for event in self.events:
+            args = {"commands": event["commands"], "nodes": event["nodes"]}
+            args.update(event.get("args", {}))
+            events.append(
+                {
+                    "name": event["name"],
+                    "cat": "shrinkwrap",
+                    "ph": "X",
+                    "ts": event["start"] * 1e6,
+                    "dur": event["seconds"] * 1e6,
+                    "pid": pid,
+                    "tid": event["thread"],
+                    "args": args
+                }
+            )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, directory, name):
+        """Write the json report and Chrome trace.
+
+        Returns:
+            tuple: Paths to the report and the trace.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        report_path = os.path.join(directory, name + "_profile.json")
+        with open(report_path, "w") as f:
+            json.dump(self.report(), f, sort_keys=True, indent=4)
+
+        trace_path = os.path.join(directory, name + "_trace.json")
+        with open(trace_path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+        return report_path, trace_path
+
+
+def stage(name, args=None):
+    """Context manager timing a stage when a profile is active."""
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name, args)
+
+
+@contextlib.contextmanager
+def profile(directory=None, name="shrinkwrap", enabled=True):
+    """Profile all stages run within the context.
+
+    Args:
+        directory (str): Directory to write the report and trace to. Nothing
+            is written when None.
+        name (str): Prefix of the file names.
+        enabled (bool): When False nothing is profiled.
+
+    Yields:
+        Profiler: The active profiler, or None when disabled.
+            Profiles started within an active profile yield the active
+            profiler and write nothing.
+    """
+    global _active
+
+    # Stages of a nested profile go to the outer one.
+    if not enabled or _active is not None:
+        yield _active
+        return
+
+    profiler = Profiler()
+    profiler.start()
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        _active = None
+        profiler.stop()
+        if directory:
+            for path in profiler.write(directory, name):
+                print("Shrinkwrap profile written to {0}".format(path))
@@ -1,115 +1,207 @@
 """
-Operates with runtime PointOnPolyConstraint which means it takes the last used
-settings. This can make the build wrong, so need to make sure the settings on
-PointOnPolyConstraint is reset before building.
-PointOnPolyConstraint is also dependent on UVs, so make sure there are no
+Point on poly controls are attached with pointOnPolyConstraints at explicit
+UVs, read from the smoothed mesh when planning the rig.
+PointOnPolyConstraint is dependent on UVs, so make sure there are no
 overlapping UVs.
 """
 
-import operator
 from functools import partial
+import concurrent.futures
+import contextlib
 import json
+import os
+import tempfile
+import threading
+import time
 
 import pymel.core as pm
+from maya import cmds
 from maya.app.general.mayaMixin import MayaQWidgetDockableMixin
 
-from mgear.core import skin, curve, icon, vector
+from mgear.core import skin, curve, icon
 from mgear.vendor.Qt import QtWidgets, QtCore
 import mgear.core.pyqt as gqt
 from mgear.rigbits import facial_rigger
 
+import shrinkwrap_cache
+import shrinkwrap_geometry
+import shrinkwrap_naming
+import shrinkwrap_plan
+import shrinkwrap_profiler
+import shrinkwrap_snapshot
+import shrinkwrap_topology
+import skin_weights
 
-def create_edge_joint(edge, up_vector_position, up_vector_highest=False):
-    # Get the vertices the edge is connected to
-    edgeVerts = edge.connectedVertices()
-
-    # Cluster the verts.
-    # We will use this to get the position for our joint
-    clusTfm = pm.cluster(edgeVerts)[1]
-
-    pm.select(clear=True)
-    # Create our joint
-    jnt = pm.joint()
-
-    # getPosition doesn't give us the correct result. This does
-    pos = clusTfm.rotatePivot.get()
-    # We don't need the cluster any more
-    pm.delete(clusTfm)
-
-    # Now we calculate the average normal
-    normals = []
-    for face in edge.connectedFaces():
-        # Collect the normal of every face
-        normals.append(face.getNormal(space="world"))
-
-    # Variable that will store the sum of all normals
-    normalsSum = pm.datatypes.Vector()
-    for normal in normals:
-        normalsSum += normal
-
-    # This will be our vector for the x axis
-    # Average normal.
-    # We divide the normal by the total number of vectors
-    xVec = (normalsSum / len(normals))
-
-    # The vertex that has the highest position,
-    # will be the vertex that our Y axis will point to
-    upVec = None
-    for i, vert in enumerate(edgeVerts):
-        # We take the first vert as our up vector
-        if i == 0:
-            upVec = edgeVerts[0].getPosition(space="world")
-
-        # And compare the other to it
-        vertPos = edgeVerts[i].getPosition(space="world")
-        if vertPos[1] >= upVec[1]:
-            upVec = vertPos
-
-    # This gives us a vector that points from the center
-    # of the selection to the highest vertex
-    if up_vector_highest:
-        up_vector_position = upVec - pos
-    else:
-        up_vector_position = up_vector_position - pos
-
-    # We get the z vector from the cross product of our x vector
-    # and the up vector
-    zVec = xVec.cross(up_vector_position)
-    # Calculate the y vec the same way. We could use the up_vector_position
-    # but this way we make sure they are all correct
-    yVec = zVec.cross(xVec)
-
-    # Normalize all vectors so scaling doesn't get messed up
-    xVec.normalize()
-    yVec.normalize()
-    zVec.normalize()
-
-    # Construct the matrix from the vectors we calculated
-    jntMtx = pm.dt.Matrix(-zVec, yVec, xVec, pos)
-    # And set the joints matrix to our new matrix
-    jnt.setMatrix(jntMtx)
-
-    # This transfers the rotation values
-    # to the joint orientation values.
-    pm.makeIdentity(jnt, r=True, apply=True)
-
-    return jnt
-
-
-def order_verts_by_edge_connection(connected_verts, results=[]):
+
+def create_joint(name, matrix):
+    """Create a joint from a matrix, with the rotation as joint orient."""
+    joint = pm.createNode("joint", name=name)
+    joint.translate.set(matrix[3][:3])
+    joint.jointOrient.set(shrinkwrap_geometry.matrix_to_euler(matrix))
+    return joint
+
+
+def point_on_poly_constraint(geo, node, uv):
+    """Constrain a node to a mesh at an explicit UV.
+
+    Unlike the PointOnPolyConstraint runtime command, this does not depend
+    on the selection or on the last used settings.
     """
-    Orders connected verts by edge connection.
+    constraint = pm.pointOnPolyConstraint(geo, node)
+    target = geo.nodeName()
+    constraint.attr("{0}U0".format(target)).set(uv[0])
+    constraint.attr("{0}V0".format(target)).set(uv[1])
+    return constraint
+
+
+def _reset_local_transform(node):
+    node.translate.set([0, 0, 0])
+    node.rotate.set([0, 0, 0])
+    node.scale.set([1, 1, 1])
+    if node.hasAttr("jointOrient"):
+        node.jointOrient.set([0, 0, 0])
+
+
+def matrix_constraint(driver, driven):
+    """Drive a node with the world matrix of another node.
+
+    Matrix network equivalent of a parentConstraint without offset. The
+    driven node's local transform is reset and the world matrix goes through
+    offsetParentMatrix, which needs Maya 2020 or later.
     """
-    next_verts = []
-    for vert in results[-1].connectedVertices():
-        if vert in connected_verts:
-            next_verts.append(vert)
-    for vert in next_verts:
-        if vert not in results:
-            results.append(vert)
-            break
+    mult_matrix = pm.createNode(
+        "multMatrix", name="{0}_multMatrix".format(driven.name())
+    )
+    driver.worldMatrix[0] >> mult_matrix.matrixIn[0]
+    driven.parentInverseMatrix[0] >> mult_matrix.matrixIn[1]
+    mult_matrix.matrixSum >> driven.offsetParentMatrix
+    _reset_local_transform(driven)
+    return mult_matrix
 
-    return results
+
+def matrix_blend_constraint(drivers, driven):
+    """Drive a node with a weighted blend of other nodes, keeping offsets.
+
+    Matrix network equivalent of a parentConstraint with maintainOffset and
+    several weighted targets. Needs Maya 2020 or later for blendMatrix and
+    offsetParentMatrix.
+
+    Args:
+        drivers (list): Tuples of driver node and weight.
+        driven (PyNode): Node to drive.
+    """
+    driven_matrix = driven.getMatrix(worldSpace=True)
+    blend_matrix = pm.createNode(
+        "blendMatrix", name="{0}_blendMatrix".format(driven.name())
+    )
+
+    # Blending happens in sequence, so each target weight is relative to the
+    # weights blended before it.
+    total_weight = 0.0
+    for index, (driver, weight) in enumerate(drivers):
+        offset_matrix = (
+            driven_matrix * driver.getMatrix(worldSpace=True).inverse()
+        )
+        mult_matrix = pm.createNode(
+            "multMatrix",
+            name="{0}_offset{1}_multMatrix".format(driven.name(), index)
+        )
+        mult_matrix.matrixIn[0].set(offset_matrix)
+        driver.worldMatrix[0] >> mult_matrix.matrixIn[1]
+
+        total_weight += weight
+        if index == 0:
+            mult_matrix.matrixSum >> blend_matrix.inputMatrix
+            continue
+
+        target = blend_matrix.target[index - 1]
+        mult_matrix.matrixSum >> target.targetMatrix
+        target.weight.set(weight / total_weight if total_weight else 0.0)
+
+    mult_matrix = pm.createNode(
+        "multMatrix", name="{0}_multMatrix".format(driven.name())
+    )
+    blend_matrix.outputMatrix >> mult_matrix.matrixIn[0]
+    driven.parentInverseMatrix[0] >> mult_matrix.matrixIn[1]
+    mult_matrix.matrixSum >> driven.offsetParentMatrix
+    _reset_local_transform(driven)
+    return blend_matrix
+
+
+class ControlFactory(object):
+    """Creates controls by duplicating icon templates built once per build.
+
+    The size, rotation and offset of the controls are baked into the
+    template shapes, so each control only needs duplicating under its parent.
+    """
+
+    def __init__(self):
+        self.templates = {}
+
+    def _template(self, icon_name, color, rotation, translation, size):
+        key = (
+            icon_name,
+            tuple(color),
+            tuple(rotation),
+            tuple(translation),
+            size
+        )
+        if key in self.templates:
+            return self.templates[key]
+
+        template = icon.create(
+            name="shrinkwrap_{0}_template".format(icon_name),
+            icon=icon_name,
+            color=list(color)
+        )
+        template.rotate.set(rotation)
+        template.translate.set(translation)
+        template.scale.set([size, size, size])
+        pm.makeIdentity(template, apply=True)
+        template.resetFromRestPosition()
+
+        self.templates[key] = template
+        return template
+
+    def create(self,
+               name,
+               parent,
+               icon_name="cube",
+               color=(0, 0, 0),
+               rotation=(0, 0, 0),
+               translation=(0, 0, 0),
+               size=1.0):
+        """Create a control under a parent, with an identity transform.
+
+        Args:
+            name (str): Name of the control.
+            parent (PyNode): Parent of the control.
+            icon_name (str): mGear icon.
+            color (list): Control color.
+            rotation (list): Rotation baked into the shape.
+            translation (list): Offset baked into the shape.
+            size (float): Scale baked into the shape.
+
+        Returns:
+            PyNode: Control transform.
+        """
+        template = self._template(
+            icon_name, color, rotation, translation, size
+        )
+        control = pm.duplicate(template, name=name)[0]
+        pm.parent(control, parent, relative=True)
+        for index, shape in enumerate(control.getShapes()):
+            pm.rename(
+                shape, "{0}Shape{1}".format(name, index if index else "")
+            )
+
+        return control
+
+    def delete(self):
+        """Delete the templates."""
+        if self.templates:
+            pm.delete(list(self.templates.values()))
+        self.templates = {}
 
 
 def extract_organization_keys(data):
@@ -144,72 +236,88 @@ def organize_results(data, **kwargs):
             node.addMembers(data[key])
 
 
-class rename_object(object):
-
-    def __init__(self, node):
-        self.node = node
-        self.x = node.getTranslation(space="world")[0]
-        self.y = node.getTranslation(space="world")[1]
-        self.name = ""
-
-
-def rename_by_position(nodes, tolerance=0.001, prefix="", suffix=""):
+def rename_by_position(nodes,
+                       tolerance=0.001,
+                       prefix="",
+                       suffix="",
+                       dry_run=False):
     """Rename nodes based on position.
 
-    Finds a unique name by indexing in x axis.
+    Finds a unique name by indexing in x axis. With dry_run the planned names
+    are returned without renaming anything.
     """
     nodes = [pm.PyNode(x) for x in nodes]
+    if not nodes:
+        return []
+
+    # Read all world positions in one call.
+    translations = cmds.xform(
+        [node.longName() for node in nodes],
+        query=True,
+        worldSpace=True,
+        translation=True
+    )
+    positions = [
+        translations[index:index + 3]
+        for index in range(0, len(translations), 3)
+    ]
 
-    objects = []
-    for node in nodes:
-        objects.append(rename_object(node))
-
-    # Sort by y axis, top to bottom
-    objects.sort(key=operator.attrgetter("y"))
-    objects.reverse()
-
-    # Get positional pairs
-    objects_copy = list(objects)
-    position_pairs = []
-    for count in range(0, len(objects_copy)):
-        a = objects_copy[0]
-        del(objects_copy[0])
-        for b in objects_copy:
-            if abs(a.y - b.y) <= tolerance:
-                position_pairs.append([a, b])
-
-    # Name positional pairs
-    for pair in position_pairs:
-        # Sort pairs by x value.
-        pair.sort(key=operator.attrgetter("x"))
-        index = position_pairs.index(pair) + 1
-        pair[0].name = "{0}{1:0>2}".format("Rt", index)
-        pair[1].name = "{0}{1:0>2}".format("Lt", index)
-
-    # Name nodes
-    center_count = 1
-    for object in objects:
-        # Non positional pairs will be center "C"
-        if not object.name:
-            object.name = "{0}{1:0>2}".format("C", center_count)
-            center_count += 1
-
-        if prefix:
-            object.name = prefix + object.name
-
-        if suffix:
-            object.name = object.name + suffix
-
-        pm.rename(object.node, object.name)
+    results = []
+    for index, name in shrinkwrap_naming.plan_names(
+        positions, tolerance=tolerance, prefix=prefix, suffix=suffix
+    ):
+        results.append((nodes[index], name))
+        if not dry_run:
+            pm.rename(nodes[index], name)
+
+    return results
 
 
 def rig(*args, **kwargs):
+    """Build a shrinkwrap rig.
+
+    With profile, the time, scene commands and created nodes of every stage
+    are written as a json report and a Chrome trace to profile_directory,
+    or the temporary directory.
+    """
     tolerance = kwargs["tolerance"]
     kwargs.pop("tolerance")
+    cache_directory = kwargs.pop("cache_directory", None)
+    matrix_network = kwargs.pop("matrix_network", False)
+    profile = kwargs.pop("profile", False)
+    profile_directory = kwargs.pop("profile_directory", None)
+
+    with shrinkwrap_profiler.profile(
+        profile_directory or tempfile.gettempdir(),
+        kwargs.get("prefix", "shrinkwrap_rig"),
+        enabled=profile
+    ):
+        kwargs, organization_keys = extract_organization_keys(kwargs)
+        if cache_directory and kwargs.get("plan") is None:
+            with shrinkwrap_profiler.stage("cached_plan"):
+                kwargs["plan"] = cached_plan(
+                    shrinkwrap_cache.PlanCache(cache_directory), **kwargs
+                )
+
+        results = _rig(*args, matrix_network=matrix_network, **kwargs)
+
+        prefix = ""
+        if "prefix" in kwargs:
+            prefix = kwargs["prefix"] + "_"
+        finish_rig(results, organization_keys, prefix, tolerance)
+
 
-    kwargs, organization_keys = extract_organization_keys(kwargs)
-    results = _rig(*args, **kwargs)
-    organize_results(results, **organization_keys)
+def finish_rig(results, organization_keys, prefix, tolerance):
+    """Organize the built nodes and name the controls by position.
+
+    Args:
+        results (dict): Built nodes, as returned by apply_plan.
+        organization_keys (dict): Groups and sets to organize into.
+        prefix (str): Prefix of the control names.
+        tolerance (float): Naming tolerance.
+    """
+    with shrinkwrap_profiler.stage("organize"):
+        organize_results(results, **organization_keys)
 
     # Dont rename master control or pop controls.
     nodes = []
@@ -220,12 +328,13 @@ def rig(*args, **kwargs):
             continue
         nodes.append(node)
 
-    prefix = ""
-    if "prefix" in kwargs:
-        prefix = kwargs["prefix"] + "_"
-    rename_by_position(
-        nodes, tolerance=tolerance, prefix=prefix, suffix="_ctrl"
-    )
+    with shrinkwrap_profiler.stage("rename"):
+        rename_by_position(
+            nodes,
+            tolerance=tolerance,
+            prefix=prefix,
+            suffix="_ctrl"
+        )
 
 
 def _rig(mesh=None,
@@ -237,537 +346,883 @@ def _rig(mesh=None,
          prefix="shrinkwrap_rig",
          control_size=1.0,
          control_offset=0.0,
-         mesh_divisions=1):
+         mesh_divisions=1,
+         plan=None,
+         matrix_network=False):
+
+    if plan is None:
+        with shrinkwrap_profiler.stage("plan"):
+            plan = plan_rig(
+                mesh=mesh,
+                shrinkwrap_mesh=shrinkwrap_mesh,
+                main_control_start=main_control_start,
+                main_control_frequency=main_control_frequency,
+                up_vector_highest=up_vector_highest,
+                flip_direction=flip_direction,
+                prefix=prefix,
+                control_size=control_size,
+                control_offset=control_offset,
+                mesh_divisions=mesh_divisions
+            )
 
-    results = {"setup_group": [], "controls_group": [], "controls_set": []}
+    with shrinkwrap_profiler.stage("apply"):
+        return apply_plan(plan, matrix_network=matrix_network)
 
-    mesh = pm.duplicate(mesh)[0]
-    pm.rename(mesh, prefix + "_wrap")
-    results["setup_group"].append(mesh)
 
-    connecting_edges = []
-    border_edges = []
-    for edge in mesh.edges:
-        if edge.isOnBoundary():
-            border_edges.append(edge)
-        else:
-            connecting_edges.append(edge)
-
-    # Split boundary edges into borders
-    first_edge_border = [border_edges[0]]
-    second_edge_border = list(border_edges)
-    for count in range(0, len(connecting_edges)):
-        for edge in first_edge_border:
-            if edge in second_edge_border:
-                second_edge_border.remove(edge)
-            for connected_edge in edge.connectedEdges():
-                if not connected_edge.isOnBoundary():
-                    continue
-                if connected_edge in first_edge_border:
-                    continue
+def read_mesh_data(mesh):
+    """Topology and world points of a mesh."""
+    return (
+        shrinkwrap_topology.MeshTopology.from_mesh(mesh),
+        shrinkwrap_geometry.points_from_mesh(mesh)
+    )
 
-                first_edge_border.append(connected_edge)
-
-    border_edges = second_edge_border
-    if flip_direction:
-        border_edges = first_edge_border
-    boundary_verts = []
-    for edge in border_edges:
-        for vert in edge.connectedVertices():
-            if vert in boundary_verts:
-                continue
-            boundary_verts.append(vert)
-
-    # Order boundary verts by connection.
-    ordered_verts = [boundary_verts[0]]
-    for count in range(0, len(boundary_verts)):
-        ordered_verts = order_verts_by_edge_connection(
-            boundary_verts, ordered_verts
-        )
 
-    # Order connecting edges by ordered boundary verts.
-    ordered_edges = []
-    for vert in ordered_verts:
-        for edge in vert.connectedEdges():
-            if edge in connecting_edges:
-                ordered_edges.append(edge)
-    ordered_edges = (
-        ordered_edges[main_control_start:] + ordered_edges[:main_control_start]
-    )
+@contextlib.contextmanager
+def undo_disabled():
+    """Keep the scene edits within the context off the undo queue.
 
-    # Place joints.
-    joints = []
-    for edge in ordered_edges:
-        up_vector_position = None
-        for vert in edge.connectedVertices():
-            if vert in ordered_verts:
-                up_vector_position = vert.getPosition(space="world")
-                break
-
-        joint = create_edge_joint(
-            edge, up_vector_position, up_vector_highest
-        )
-        pm.rename(
-            joint,
-            "{0}_shrinkwrap{1:0>2}_jnt".format(
-                prefix, ordered_edges.index(edge)
+    For temporary nodes that are deleted again, so undoing never brings
+    them back.
+    """
+    enabled = cmds.undoInfo(query=True, state=True)
+    if enabled:
+        cmds.undoInfo(stateWithoutFlush=False)
+    try:
+        yield
+    finally:
+        if enabled:
+            cmds.undoInfo(stateWithoutFlush=True)
+
+
+def read_smooth_data(mesh, shrinkwrap_mesh, mesh_divisions):
+    """Topology, world points and UVs of a mesh after smoothing and
+    shrinkwrapping.
+
+    The data is read from a temporary copy of the mesh, which is deleted
+    again without touching the undo queue.
+    """
+    with undo_disabled():
+        smooth_mesh = _smooth_copy(mesh, shrinkwrap_mesh, mesh_divisions)
+        try:
+            topology, points = read_mesh_data(smooth_mesh)
+            uvs = shrinkwrap_geometry.vertex_uvs_from_mesh(
+                smooth_mesh, topology
             )
-        )
-        joints.append(joint)
+        finally:
+            pm.delete(smooth_mesh)
+    return topology, points, uvs
 
-        results["setup_group"].append(joint)
 
-    # Skin mesh. One connected_edge per joint.
-    skinCluster = skin.getSkinCluster(mesh)
-    if not skinCluster:
-        skinCluster = pm.skinCluster(joints, mesh, toSelectedBones=True, nw=2)
+def _smooth_copy(mesh, shrinkwrap_mesh, mesh_divisions):
+    """Smoothed copy of a mesh, shrinkwrapped to the shrinkwrap mesh."""
+    smooth_mesh = pm.duplicate(mesh)[0]
+    pm.polySmooth(smooth_mesh, divisions=mesh_divisions, keepBorder=False)
+    shrinkWrapNode = pm.deformer(smooth_mesh, type="shrinkWrap")[0]
+    pm.PyNode(shrinkwrap_mesh).worldMesh[0] >> shrinkWrapNode.targetGeom
+    shrinkWrapNode.projection.set(4)
+    return smooth_mesh
 
-    pm.skinPercent(skinCluster, mesh, pruneWeights=100, normalize=False)
-    for edge in ordered_edges:
-        joint = joints[ordered_edges.index(edge)]
-        for vert in edge.connectedVertices():
-            pm.skinPercent(skinCluster, vert, transformValue=[(joint, 1.0)])
 
-    # Master control
-    clusTfm = pm.cluster(ordered_verts)[1]
-    center_position = clusTfm.rotatePivot.get()
-    pm.delete(clusTfm)
-
-    master_group = pm.group(name="{0}_master_grp".format(prefix), empty=True)
-    master_group.setTranslation(center_position)
-    results["controls_group"].append(master_group)
-
-    master_null = pm.duplicate(master_group)[0]
-    pm.rename(master_null, "{0}_master_null".format(prefix))
-    pm.parent(master_null, master_group)
-
-    points = []
-    for joint in joints:
-        pm.move(
-            joint,
-            [0, 0, control_offset],
-            relative=True,
-            objectSpace=True
-        )
-        points.append(joint.getTranslation(space="world"))
-        pm.move(
-            joint,
-            [0, 0, -control_offset],
-            relative=True,
-            objectSpace=True
-        )
-    master_control = curve.addCurve(
-        master_null,
-        "{0}_master_ctrl".format(prefix),
-        points,
-        close=True,
-        degree=1
+def export_snapshots(config, directory):
+    """Write what planning a rig needs, for planning outside of Maya.
+
+    Writes snapshots of the mesh and of its smoothed, shrinkwrapped copy
+    plus the configuration, to plan with shrinkwrap_snapshot.
+
+    Args:
+        config (dict): Rig configuration, as passed to rig.
+        directory (str): Directory to write to.
+
+    Returns:
+        tuple: Paths to the mesh snapshot, smoothed mesh snapshot and
+            configuration.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    prefix = config.get("prefix", "shrinkwrap_rig")
+    mesh_path = os.path.join(directory, prefix + "_mesh.snapshot")
+    smooth_path = os.path.join(directory, prefix + "_smooth.snapshot")
+    config_path = os.path.join(directory, prefix + ".shrinkwrap")
+
+    shrinkwrap_snapshot.MeshSnapshot.from_mesh(config["mesh"]).save(
+        mesh_path
     )
-    curve.set_color(master_control, [1, 1, 0])
-    pm.makeIdentity(master_control, apply=True)
-    master_control.resetFromRestPosition()
-    results["controls_set"].append(master_control)
-
-    # Create controls with parent and children. Relationship is determined by
-    # skipping edges in the ring. Starting point is configurable.
-    # Parent controls
-    parent_controls = []
-    for joint in joints[::main_control_frequency]:
-        group = pm.group(
-            name="{0}_main{1:0>2}_grp".format(prefix, joints.index(joint)),
-            empty=True
-        )
-        group.setMatrix(joint.getMatrix())
 
-        null = pm.group(
-            name="{0}_main{1:0>2}_null".format(prefix, joints.index(joint)),
-            empty=True
+    with undo_disabled():
+        smooth_mesh = _smooth_copy(
+            config["mesh"],
+            config["shrinkwrap_mesh"],
+            config.get("mesh_divisions", 1)
         )
-        null.setMatrix(joint.getMatrix())
+        try:
+            snapshot = shrinkwrap_snapshot.MeshSnapshot.from_mesh(smooth_mesh)
+        finally:
+            pm.delete(smooth_mesh)
+    snapshot.save(smooth_path)
 
-        control = icon.create(
-            name="{0}_main{1:0>2}_ctrl".format(prefix, joints.index(joint)),
-            icon="cube",
-            color=[1, 0, 0]
-        )
-        control.setMatrix(group.getMatrix())
-        pm.rotate(control, [0, 0, 90], relative=True, objectSpace=True)
-        results["controls_set"].append(control)
-
-        pm.parent(group, master_control)
-        pm.parent(null, group)
-        pm.parent(control, null)
-
-        pm.move(
-            control,
-            [0, 0, control_offset],
-            relative=True,
-            objectSpace=True
-        )
-        pm.scale(control, [control_size, control_size, control_size])
-        pm.makeIdentity(control, apply=True)
-        control.resetFromRestPosition()
-        pm.parentConstraint(control, joint)
-        parent_controls.append(control)
-
-    # Child controls
-    parent_index = 0
-    # Duplicate the parent controls to loop back around.
-    parents = parent_controls + parent_controls
-    for joint in joints:
-        if joint in joints[::main_control_frequency]:
-            parent_index += 1
-            continue
+    with open(config_path, "w") as f:
+        json.dump(config, f, sort_keys=True, indent=4)
 
-        group = pm.group(
-            name="{0}_main{1:0>2}_grp".format(prefix, joints.index(joint)),
-            empty=True
-        )
-        group.setMatrix(joint.getMatrix())
+    return mesh_path, smooth_path, config_path
 
-        null = pm.group(
-            name="{0}_main{1:0>2}_null".format(prefix, joints.index(joint)),
-            empty=True
-        )
-        null.setMatrix(joint.getMatrix())
 
-        control = icon.create(
-            name="{0}_main{1:0>2}_ctrl".format(prefix, joints.index(joint)),
-            icon="sphere",
-            color=[0, 1, 0]
+def plan_rig(mesh=None, shrinkwrap_mesh=None, mesh_divisions=1, **kwargs):
+    """Analyse the meshes and plan the rig, without building anything."""
+    with shrinkwrap_profiler.stage("read_mesh"):
+        topology, points = read_mesh_data(mesh)
+    with shrinkwrap_profiler.stage("read_smooth_mesh"):
+        smooth_topology, smooth_points, smooth_uvs = read_smooth_data(
+            mesh, shrinkwrap_mesh, mesh_divisions
         )
-        control.setMatrix(group.getMatrix())
-        pm.rotate(control, [0, 0, 90], relative=True, objectSpace=True)
-        results["controls_set"].append(control)
-
-        pm.parent(group, master_control)
-        pm.parent(null, group)
-        pm.parent(control, null)
-
-        pm.move(
-            control,
-            [0, 0, control_offset],
-            relative=True,
-            objectSpace=True
+
+    with shrinkwrap_profiler.stage("build_plan"):
+        return shrinkwrap_plan.build_plan(
+            topology,
+            points,
+            smooth_topology,
+            smooth_points,
+            smooth_uvs=smooth_uvs,
+            mesh=str(mesh),
+            shrinkwrap_mesh=str(shrinkwrap_mesh),
+            mesh_divisions=mesh_divisions,
+            **kwargs
         )
-        pm.scale(control, [control_size, control_size, control_size])
-        pm.makeIdentity(control, apply=True)
-        control.resetFromRestPosition()
 
-        pm.parentConstraint(control, joint)
 
-        weight = parent_index - (
-            float(joints.index(joint)) / main_control_frequency
-        )
-        parent_constraint = pm.parentConstraint(
-            parents[parent_index],
-            group,
-            weight=1.0 - weight,
-            maintainOffset=True
-        )
-        pm.parentConstraint(
-            parents[parent_index - 1],
-            group,
-            weight=weight,
-            maintainOffset=True
-        )
+def _plan_settings(config):
+    """The settings of a configuration that go into the plan."""
+    settings = dict(config)
+    settings.pop("tolerance", None)
+    settings.pop("cache_directory", None)
+    settings.pop("plan", None)
+    settings.pop("matrix_network", None)
+    settings.pop("profile", None)
+    settings.pop("profile_directory", None)
+    settings, _ = extract_organization_keys(settings)
+    return settings
+
+
+def _cache_key(cache, fingerprints, settings):
+    return cache.key(
+        [
+            fingerprints[settings["mesh"]],
+            fingerprints[settings["shrinkwrap_mesh"]]
+        ],
+        settings
+    )
 
-        parent_constraint.interpType.set(2)
 
-    # Storing vert pairs before subdivding the mesh.
-    vert_pairs = []
-    for edge in ordered_edges:
-        vert_pairs.append(edge.connectedVertices())
+def plan_many(configs, cache_directory=None, executor=None):
+    """Plan several rigs, sharing the mesh analysis between them.
 
-    border_verts = pm.ls(
-        pm.polyListComponentConversion(
-            border_edges, fromEdge=True, toVertex=True
-        ),
-        flatten=True
-    )
+    Configurations are grouped by source mesh, so each mesh is only read
+    once, and each smoothed mesh only once per shrinkwrap mesh and division
+    count. Scene reads happen serially, then the plans are solved.
 
-    # Adding mesh divisions.
-    pm.polySmooth(mesh, divisions=mesh_divisions, keepBorder=False)
+    Planning is pure Python and CPU bound, so threads do not speed it up.
+    Plans are solved serially unless an executor is given. The plan inputs
+    and outputs are plain data, so a ProcessPoolExecutor can solve them,
+    but inside interactive Maya sys.executable is the Maya binary. Its
+    workers only start once multiprocessing.set_executable points at
+    mayapy, and shrinkwrap_plan has to be importable from their sys.path.
 
-    # Setup shrinkwrap
-    shrinkWrapNode = pm.deformer(mesh, type="shrinkWrap")[0]
-    pm.PyNode(shrinkwrap_mesh).worldMesh[0] >> shrinkWrapNode.targetGeom
-    shrinkWrapNode.projection.set(4)
+    Args:
+        configs (list): Rig configurations, as passed to rig.
+        cache_directory (str): Plan cache directory.
+        executor (concurrent.futures.Executor): Executor to solve the plans
+            on. Solved serially when None.
 
-    master_control.addAttr(
-        "wobble_smooth",
-        min=0,
-        max=10
-    )
-    master_control.wobble_smooth >> shrinkWrapNode.targetSmoothLevel
-    master_control.wobble_smooth.set(keyable=False, channelBox=True)
-
-    # Setup point on poly controls.
-    # Getting edge loop verts.
-    middle_verts = []
-    for pair in vert_pairs:
-        pm.select(clear=True)
-        pm.polySelect(
-            mesh,
-            shortestEdgePath=(
-                pair[0].index(),
-                pair[1].index()
+    Returns:
+        list: Plan per configuration.
+    """
+    settings_list = [_plan_settings(config) for config in configs]
+    plans = [None] * len(configs)
+
+    cache = None
+    fingerprints = {}
+    if cache_directory:
+        cache = shrinkwrap_cache.PlanCache(cache_directory)
+        for settings in settings_list:
+            for key in ["mesh", "shrinkwrap_mesh"]:
+                if settings[key] not in fingerprints:
+                    fingerprints[settings[key]] = (
+                        shrinkwrap_cache.mesh_fingerprint(settings[key])
+                    )
+
+        for index, settings in enumerate(settings_list):
+            plans[index] = cache.get(
+                _cache_key(cache, fingerprints, settings)
             )
+
+    # Read the scene once per source mesh and smoothing.
+    mesh_data = {}
+    smooth_data = {}
+    for index, settings in enumerate(settings_list):
+        if plans[index] is not None:
+            continue
+
+        mesh = settings["mesh"]
+        if mesh not in mesh_data:
+            mesh_data[mesh] = read_mesh_data(mesh)
+
+        smooth_key = (
+            mesh,
+            settings["shrinkwrap_mesh"],
+            settings.get("mesh_divisions", 1)
         )
-        verts = pm.ls(
-            pm.polyListComponentConversion(
-                pm.ls(selection=True, flatten=True),
-                fromEdge=True,
-                toVertex=True
-            ),
-            flatten=True
+        if smooth_key not in smooth_data:
+            smooth_data[smooth_key] = read_smooth_data(*smooth_key)
+
+    jobs = {}
+    solved = []
+    for index, settings in enumerate(settings_list):
+        if plans[index] is not None:
+            continue
+
+        solved.append(index)
+
+        smooth_key = (
+            settings["mesh"],
+            settings["shrinkwrap_mesh"],
+            settings.get("mesh_divisions", 1)
         )
-        edge_count = len(pm.ls(selection=True, flatten=True))
-        connected_verts = [pair[0]]
-        for count in range(0, edge_count // 2):
-            temp_verts = pm.ls(
-                connected_verts[-1].connectedVertices(), flatten=True
+        topology, points = mesh_data[settings["mesh"]]
+        smooth_topology, smooth_points, smooth_uvs = smooth_data[smooth_key]
+        args = (topology, points, smooth_topology, smooth_points)
+        kwargs = dict(settings, smooth_uvs=smooth_uvs)
+        if executor is None:
+            plans[index] = shrinkwrap_plan.build_plan(*args, **kwargs)
+        else:
+            future = executor.submit(
+                shrinkwrap_plan.build_plan, *args, **kwargs
             )
-            for vert in temp_verts:
-                if vert in connected_verts:
-                    continue
-                if vert in verts:
-                    connected_verts.append(vert)
-                    break
+            jobs[future] = index
 
-        middle_verts.append(connected_verts[-1])
+    for future in concurrent.futures.as_completed(jobs):
+        plans[jobs[future]] = future.result()
 
-    pm.select(clear=True)
-    for count in range(0, len(middle_verts)):
-        pm.polySelect(
-            mesh,
-            shortestEdgePath=(
-                middle_verts[count - 1].index(), middle_verts[count].index()
+    if cache is not None:
+        for index in solved:
+            cache.put(
+                _cache_key(cache, fingerprints, settings_list[index]),
+                plans[index]
             )
+
+    return plans
+
+
+def rig_many(configs, cache_directory=None, executor=None):
+    """Build several rigs, sharing the mesh analysis between them.
+
+    All plans are solved first, then the rigs are built serially. The
+    planning scene reads and the builds share one undo chunk.
+
+    Args:
+        configs (list): Rig configurations, as passed to rig.
+        cache_directory (str): Plan cache directory.
+        executor (concurrent.futures.Executor): Executor to solve the plans
+            on. Solved serially when None.
+    """
+    with pm.UndoChunk():
+        plans = plan_many(
+            configs, cache_directory=cache_directory, executor=executor
         )
+        for config, plan in zip(configs, plans):
+            kwargs = dict(config)
+            kwargs["plan"] = plan
+            rig(**kwargs)
 
-    verts = pm.ls(
-        pm.polyListComponentConversion(
-            pm.ls(selection=True, flatten=True), fromEdge=True, toVertex=True
-        ),
-        flatten=True
+
+def cached_plan(cache, **kwargs):
+    """Plan from the cache, or plan the rig and cache it on a miss."""
+    kwargs.pop("plan", None)
+    key = cache.key(
+        [
+            shrinkwrap_cache.mesh_fingerprint(kwargs["mesh"]),
+            shrinkwrap_cache.mesh_fingerprint(kwargs["shrinkwrap_mesh"])
+        ],
+        kwargs
     )
+    plan = cache.get(key)
+    if plan is None:
+        plan = plan_rig(**kwargs)
+        cache.put(key, plan)
 
-    # Get look at verts.
-    edges = []
-    for vert in border_verts:
-        shortest_distance = None
-        targets = list(border_verts)
-        targets.remove(vert)
-        for target in targets:
-            pm.select(clear=True)
-            pm.polySelect(
-                mesh,
-                shortestEdgePath=(
-                    vert.index(),
-                    target.index()
+    return plan
+
+
+def apply_plan(plan, matrix_network=False):
+    """Build the rig from a plan.
+
+    With matrix_network the controls drive the joints and groups through
+    offsetParentMatrix networks instead of parentConstraints.
+    """
+    results = {}
+    for _ in apply_plan_steps(plan, results, matrix_network):
+        pass
+
+    return results
+
+
+def apply_plan_step_count(plan):
+    """Number of steps apply_plan_steps yields for a plan."""
+    return 5 + len(plan["controls"]) + len(plan["pop"]["vertices"])
+
+
+def apply_plan_steps(plan, results, matrix_network=False):
+    """Build the rig from a plan, yielding a message after each step.
+
+    The caller can report progress or process events between the steps.
+    The created nodes are collected in results.
+    """
+    settings = plan["settings"]
+    prefix = settings["prefix"]
+    control_size = settings["control_size"]
+    control_offset = settings["control_offset"]
+
+    results.update(
+        {"setup_group": [], "controls_group": [], "controls_set": []}
+    )
+
+    with shrinkwrap_profiler.stage("duplicate_mesh"):
+        mesh = pm.duplicate(settings["mesh"])[0]
+        pm.rename(mesh, prefix + "_wrap")
+        results["setup_group"].append(mesh)
+
+    # Place joints.
+    with shrinkwrap_profiler.stage("joints"):
+        joints = []
+        for data in plan["joints"]:
+            joint = create_joint(data["name"], data["matrix"])
+            joints.append(joint)
+
+            results["setup_group"].append(joint)
+    yield "Created joints"
+
+    # Skin mesh. One connected_edge per joint.
+    with shrinkwrap_profiler.stage("skin_weights"):
+        skinCluster = skin.getSkinCluster(mesh)
+        if not skinCluster:
+            skinCluster = pm.skinCluster(
+                joints, mesh, toSelectedBones=True, nw=2
+            )
+
+        weights = {}
+        for vertex, joint_index, weight in plan["skin_weights"]:
+            weights.setdefault(vertex, {})[joints[joint_index]] = weight
+        skin_weights.set_weights(skinCluster, mesh, weights)
+    yield "Skinned mesh"
+
+    # Master control
+    with shrinkwrap_profiler.stage("master_control"):
+        master_group = pm.group(name=plan["master"]["group"], empty=True)
+        master_group.setTranslation(plan["master"]["position"])
+        results["controls_group"].append(master_group)
+
+        master_null = pm.duplicate(master_group)[0]
+        pm.rename(master_null, plan["master"]["null"])
+        pm.parent(master_null, master_group)
+
+        master_control = curve.addCurve(
+            master_null,
+            plan["master"]["control"],
+            plan["master"]["points"],
+            close=True,
+            degree=1
+        )
+        curve.set_color(master_control, [1, 1, 0])
+        pm.makeIdentity(master_control, apply=True)
+        master_control.resetFromRestPosition()
+        results["controls_set"].append(master_control)
+    yield "Created master control"
+
+    # The templates are deleted even when the build raises or is closed
+    # early.
+    factory = ControlFactory()
+    try:
+        # Controls. Parent controls come before the child controls blending
+        # between them.
+        with shrinkwrap_profiler.stage("controls"):
+            controls = []
+            for data in plan["controls"]:
+                group = pm.group(
+                    name=data["group"], empty=True, parent=master_control
+                )
+                group.setMatrix(pm.dt.Matrix(data["matrix"]), worldSpace=True)
+                null = pm.group(name=data["null"], empty=True, parent=group)
+
+                control = factory.create(
+                    data["name"],
+                    null,
+                    icon_name=data["icon"],
+                    color=data["color"],
+                    rotation=[0, 0, 90],
+                    translation=[0, 0, control_offset],
+                    size=control_size
                 )
+                results["controls_set"].append(control)
+
+                controls.append(control)
+
+                if matrix_network:
+                    matrix_constraint(control, joints[data["joint"]])
+                    if data["parents"]:
+                        matrix_blend_constraint(
+                            [
+                                (controls[parent_index], weight)
+                                for parent_index, weight in data["parents"]
+                            ],
+                            group
+                        )
+                    yield "Created {0}".format(data["name"])
+                    continue
+
+                pm.parentConstraint(control, joints[data["joint"]])
+
+                parent_constraint = None
+                for parent_index, weight in data["parents"]:
+                    constraint = pm.parentConstraint(
+                        controls[parent_index],
+                        group,
+                        weight=weight,
+                        maintainOffset=True
+                    )
+                    if parent_constraint is None:
+                        parent_constraint = constraint
+
+                if parent_constraint is not None:
+                    parent_constraint.interpType.set(2)
+
+                yield "Created {0}".format(data["name"])
+
+        with shrinkwrap_profiler.stage("shrinkwrap"):
+            # Adding mesh divisions.
+            pm.polySmooth(
+                mesh, divisions=settings["mesh_divisions"], keepBorder=False
             )
-            selection = pm.ls(selection=True, flatten=True)
-            if shortest_distance is None:
-                shortest_distance = len(selection)
-                vert_edges = selection
-            else:
-                if len(selection) < shortest_distance:
-                    shortest_distance = len(selection)
-                    vert_edges = selection
-                if len(selection) == shortest_distance:
-                    vert_edges.extend(selection)
-        edges.extend(vert_edges)
-
-    border_verts = pm.ls(
-        pm.polyListComponentConversion(
-            edges, fromEdge=True, toVertex=True
-        ),
-        flatten=True
-    )
 
-    look_at_verts = []
-    for middle_vert in verts:
-        closest_distance = None
-        closest_border_vert = None
-        for border_vert in border_verts:
-            distance = vector.getDistance(
-                middle_vert.getPosition(space="world"),
-                border_vert.getPosition(space="world")
+            # Setup shrinkwrap
+            shrinkWrapNode = pm.deformer(mesh, type="shrinkWrap")[0]
+            pm.PyNode(settings["shrinkwrap_mesh"]).worldMesh[0] >> (
+                shrinkWrapNode.targetGeom
             )
-            if closest_distance is None:
-                closest_distance = distance
-                closest_border_vert = border_vert
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_border_vert = border_vert
-
-        connected_verts = []
-        for vert in pm.ls(middle_vert.connectedVertices(), flatten=True):
-            if vert in middle_verts:
-                continue
-            connected_verts.append(vert)
-        closest_distance = None
-        closest_connected_vert = None
-        for connected_vert in connected_verts:
-            distance = vector.getDistance(
-                closest_border_vert.getPosition(space="world"),
-                connected_vert.getPosition(space="world")
+            shrinkWrapNode.projection.set(4)
+
+            master_control.addAttr(
+                "wobble_smooth",
+                min=0,
+                max=10
             )
-            if closest_distance is None:
-                closest_distance = distance
-                closest_connected_vert = connected_vert
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_connected_vert = connected_vert
-
-        look_at_verts.append(closest_connected_vert)
-
-    # Rig point on poly controls.
-    pop_results = _rig_pop(
-        verts,
-        look_at_verts,
-        prefix,
-        control_size / 2.0,
-        control_offset
-    )
+            master_control.wobble_smooth >> shrinkWrapNode.targetSmoothLevel
+            master_control.wobble_smooth.set(keyable=False, channelBox=True)
+        yield "Created shrinkwrap"
+
+        # Rig point on poly controls.
+        pop_results = {}
+        with shrinkwrap_profiler.stage("pop"):
+            for message in _rig_pop(
+                mesh, plan["pop"], factory, pop_results, matrix_network
+            ):
+                yield message
+    finally:
+        factory.delete()
 
     results["setup_group"].extend(pop_results["setup_group"])
     results["controls_group"].extend(pop_results["controls_group"])
     results["controls_set"].extend(pop_results["controls_set"])
     results["deformers_set"] = pop_results["deformers_set"]
     results["deformers_group"] = pop_results["deformers_group"]
+    yield "Created point on poly controls"
+
+
+def _rig_pop(geo, plan, factory, results, matrix_network=False):
+    """Rig the point on poly controls, yielding a message per control."""
+    results.update(
+        {
+            "setup_group": [],
+            "deformers_group": [],
+            "deformers_set": [],
+            "controls_group": [],
+            "controls_set": []
+        }
+    )
 
-    return results
-
-
-def _rig_pop(verts=[],
-             look_at_verts=[],
-             prefix="pop_rig",
-             control_size=1.0,
-             control_offset=0.0):
+    control_size = plan["control_size"]
+    control_offset = plan["control_offset"]
 
-    results = {
-        "setup_group": [],
-        "deformers_group": [],
-        "deformers_set": [],
-        "controls_group": [],
-        "controls_set": []
-    }
+    for data in plan["vertices"]:
+        names = data["names"]
 
-    ordered_verts = [verts[0]]
-    for count in range(0, len(verts)):
-        ordered_verts = order_verts_by_edge_connection(verts, ordered_verts)
+        with shrinkwrap_profiler.stage("pop_attach"):
+            normal_group = pm.group(name=names["normal"], empty=True)
+            point_on_poly_constraint(geo, normal_group, data["uv"])
 
-    geo = pm.listRelatives(ordered_verts[0], parent=True)[0]
+            # Break rotation connections
+            for attr in ["rx", "ry", "rz"]:
+                pm.disconnectAttr("{0}.{1}".format(normal_group, attr))
 
-    for vert in ordered_verts:
-        normal_group = pm.group(
-            name="{0}_normal{1:0>2}_grp".format(
-                prefix, ordered_verts.index(vert)
-            ),
-            empty=True
-        )
-        pm.select(vert, normal_group)
-        pm.runtime.PointOnPolyConstraint()
+            pm.normalConstraint(geo, normal_group)
 
-        # Break rotation connections
-        for attr in ["rx", "ry", "rz"]:
-            pm.disconnectAttr("{0}.{1}".format(normal_group, attr))
+            # Up vector group
+            up_vector_group = pm.group(name=names["up_vector"], empty=True)
+            up_vector_group.setMatrix(normal_group.getMatrix())
+            pm.parent(up_vector_group, normal_group)
+            up_vector_group.tx.set(0.001)
 
-        pm.normalConstraint(geo, normal_group)
-
-        # Up vector group
-        up_vector_group = pm.group(
-            name="{0}_up_vector{1:0>2}_grp".format(
-                prefix, ordered_verts.index(vert)
-            ),
-            empty=True
-        )
-        up_vector_group.setMatrix(normal_group.getMatrix())
-        pm.parent(up_vector_group, normal_group)
-        up_vector_group.tx.set(0.001)
-
-        # Look at group
-        look_at_vert = None
-        for connected_vert in vert.connectedVertices():
-            if connected_vert in look_at_verts:
-                look_at_vert = connected_vert
-
-        look_at_group = pm.group(
-            name="{0}_look_at{1:0>2}_grp".format(
-                prefix, ordered_verts.index(vert)
-            ),
-            empty=True
-        )
-        pm.select(look_at_vert, look_at_group)
-        pm.runtime.PointOnPolyConstraint()
+            # Look at group
+            look_at_group = pm.group(name=names["look_at"], empty=True)
+            point_on_poly_constraint(geo, look_at_group, data["look_at_uv"])
 
         # Parent to setup group
         results["setup_group"].append(normal_group)
         results["setup_group"].append(look_at_group)
 
         # Transform group
-        transform_group = pm.group(
-            name="{0}_transform{1:0>2}_grp".format(
-                prefix, ordered_verts.index(vert)
-            ),
-            empty=True
-        )
-        transform_group.setMatrix(normal_group.getMatrix())
-        pm.aimConstraint(
-            look_at_group,
-            transform_group,
-            aimVector=[0, 1, 0],
-            upVector=[0, 0, 1],
-            worldUpObject=up_vector_group,
-            worldUpType="object"
-        )
-        pm.parent(transform_group, normal_group)
+        with shrinkwrap_profiler.stage("pop_orient"):
+            transform_group = pm.group(name=names["transform"], empty=True)
+            transform_group.setMatrix(normal_group.getMatrix())
+            pm.aimConstraint(
+                look_at_group,
+                transform_group,
+                aimVector=[0, 1, 0],
+                upVector=[0, 0, 1],
+                worldUpObject=up_vector_group,
+                worldUpType="object"
+            )
+            pm.parent(transform_group, normal_group)
 
         # Control
-        parent_group = pm.group(
-            name="{0}_parent{1:0>2}_grp".format(
-                prefix, ordered_verts.index(vert)
-            ),
-            empty=True
+        with shrinkwrap_profiler.stage("pop_control"):
+            parent_group = pm.group(name=names["parent"], empty=True)
+            if matrix_network:
+                matrix_constraint(transform_group, parent_group)
+            else:
+                pm.parentConstraint(transform_group, parent_group)
+            results["controls_group"].append(parent_group)
+
+            control = factory.create(
+                names["control"],
+                parent_group,
+                icon_name="sphere",
+                color=[0, 0, 1],
+                translation=[0, 0, control_offset / 2.0],
+                size=control_size
+            )
+
+            results["controls_set"].append(control)
+
+        # Joint
+        with shrinkwrap_profiler.stage("pop_joint"):
+            pm.select(clear=True)
+            joint = pm.joint(name=names["joint"])
+            if matrix_network:
+                matrix_constraint(control, joint)
+            else:
+                pm.parentConstraint(control, joint)
+
+            results["deformers_group"].append(joint)
+            results["deformers_set"].append(joint)
+
+        yield "Created {0}".format(names["control"])
+
+
+def measure_output(config, matrix_network=False, frames=100):
+    """Build a rig, measure its node count and playback cost, then undo it.
+
+    The controls are keyed with a rotation over the frame range, and
+    every frame the world matrices of the deformer joints are queried to
+    force evaluation.
+
+    Args:
+        config (dict): Rig configuration, as passed to rig.
+        matrix_network (bool): Build with matrix networks.
+        frames (int): Number of frames to evaluate.
+
+    Returns:
+        dict: Node count, node count per type, seconds and frames per second.
+    """
+    current_time = cmds.currentTime(query=True)
+    before = set(cmds.ls())
+
+    kwargs = dict(config)
+    kwargs["matrix_network"] = matrix_network
+    with pm.UndoChunk():
+        rig(**kwargs)
+
+        nodes = set(cmds.ls()) - before
+
+        # Types are read before the undo removes the nodes.
+        node_types = {}
+        for node_type in [cmds.nodeType(x) for x in nodes]:
+            node_types[node_type] = node_types.get(node_type, 0) + 1
+
+        controls = [
+            x for x in cmds.ls(list(nodes), type="transform") or []
+            if x.endswith("_ctrl") and not x.endswith("_master_ctrl")
+        ]
+        joints = cmds.ls(list(nodes), type="joint") or []
+        for control in controls:
+            cmds.setKeyframe(control, attribute="rotateZ", time=0, value=0)
+            cmds.setKeyframe(
+                control, attribute="rotateZ", time=frames, value=45
+            )
+
+        start = time.time()
+        for frame in range(frames):
+            cmds.currentTime(frame, update=True)
+            for joint in joints:
+                cmds.getAttr(joint + ".worldMatrix[0]")
+        seconds = time.time() - start
+
+    pm.undo()
+    cmds.currentTime(current_time, update=True)
+
+    return {
+        "nodes": len(nodes),
+        "node_types": node_types,
+        "seconds": seconds,
+        "fps": frames / seconds if seconds else 0.0
+    }
+
+
+def compare_outputs(config, frames=100):
+    """Compare node count and playback cost of constraints and matrices.
+
+    Args:
+        config (dict): Rig configuration, as passed to rig.
+        frames (int): Number of frames to evaluate.
+
+    Returns:
+        dict: measure_output results for "constraints" and "matrix_network".
+    """
+    results = {
+        "constraints": measure_output(config, False, frames),
+        "matrix_network": measure_output(config, True, frames)
+    }
+    for key, data in results.items():
+        print(
+            "{0}: {1} nodes, {2:.3f}s for {3} frames ({4:.1f} fps)".format(
+                key, data["nodes"], data["seconds"], frames, data["fps"]
+            )
         )
-        pm.parentConstraint(transform_group, parent_group)
-        results["controls_group"].append(parent_group)
-
-        control = icon.create(
-            name="{0}_pop{1:0>2}_ctrl".format(
-                prefix, ordered_verts.index(vert)
-            ),
-            icon="sphere",
-            color=[0, 0, 1]
+
+    return results
+
+
+class BuildJob(object):
+    """A rig build that keeps the main thread free while planning.
+
+    The meshes are read on the main thread, then the plan is solved on a
+    worker thread. Once planned, the scene edits are made back on the main
+    thread in small steps, so the caller can report progress and process
+    events between them. Cancelling stops the job at the next step.
+
+    Args:
+        config (dict): Rig configuration, as passed to rig.
+        executor (concurrent.futures.Executor): Executor to plan on.
+            Defaults to a single worker thread.
+    """
+
+    def __init__(self, config, executor=None):
+        kwargs = dict(config)
+        self.tolerance = kwargs.pop("tolerance")
+        self.matrix_network = kwargs.pop("matrix_network", False)
+        self.settings = _plan_settings(kwargs)
+        _, self.organization_keys = extract_organization_keys(kwargs)
+
+        self.progress = 0.0
+        self.message = ""
+        self.future = None
+        self.executor = executor
+        self._owns_executor = executor is None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _report(self, fraction, message):
+        if self.cancelled:
+            raise shrinkwrap_plan.Cancelled()
+        self.progress = fraction
+        self.message = message
+
+    def _plan_progress(self, fraction, message):
+        self._report(0.1 + fraction * 0.4, message)
+
+    def start(self):
+        """Read the meshes and start planning on the worker thread."""
+        settings = dict(self.settings)
+        mesh = settings.pop("mesh")
+        shrinkwrap_mesh = settings.pop("shrinkwrap_mesh")
+        mesh_divisions = settings.pop("mesh_divisions", 1)
+
+        self._report(0.0, "Reading meshes")
+        topology, points = read_mesh_data(mesh)
+        smooth_topology, smooth_points, smooth_uvs = read_smooth_data(
+            mesh, shrinkwrap_mesh, mesh_divisions
         )
-        control.setMatrix(parent_group.getMatrix())
-        pm.parent(control, parent_group)
-
-        pm.scale(control, [control_size, control_size, control_size])
-        pm.move(
-            control, [0, 0, (control_offset * (1.0 / control_size)) / 2],
-            relative=True,
-            objectSpace=True
+
+        if self._owns_executor:
+            self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.future = self.executor.submit(
+            shrinkwrap_plan.build_plan,
+            topology,
+            points,
+            smooth_topology,
+            smooth_points,
+            smooth_uvs=smooth_uvs,
+            mesh=str(mesh),
+            shrinkwrap_mesh=str(shrinkwrap_mesh),
+            mesh_divisions=mesh_divisions,
+            progress=self._plan_progress,
+            **settings
         )
-        pm.makeIdentity(control, apply=True)
-        control.resetFromRestPosition()
 
-        results["controls_set"].append(control)
+    def planned(self):
+        """Whether planning has finished, failed or was cancelled."""
+        return self.future is not None and self.future.done()
+
+    def plan(self):
+        """The finished plan.
+
+        Raises Cancelled when the job was cancelled while planning, and any
+        error raised while planning.
+        """
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+        return self.future.result()
+
+    def steps(self, plan):
+        """Build the rig from the plan, yielding after each scene edit.
+
+        Must run on the main thread. Raises Cancelled when the job is
+        cancelled.
+        """
+        results = {}
+        count = apply_plan_step_count(plan)
+        steps = apply_plan_steps(plan, results, self.matrix_network)
+        try:
+            for index, message in enumerate(steps):
+                self._report(0.5 + 0.5 * index / count, message)
+                yield
+        finally:
+            # Clean up the templates now, within the build undo chunk.
+            steps.close()
+
+        self._report(1.0, "Naming controls")
+        prefix = ""
+        if "prefix" in self.settings:
+            prefix = self.settings["prefix"] + "_"
+        finish_rig(results, self.organization_keys, prefix, self.tolerance)
+
+
+class Preview(object):
+    """Lightweight preview of the controls of a rig.
+
+    The ring is solved once from the source mesh. Changing the control
+    offset, size or main controls afterwards only moves a curve through the
+    controls and a locator per main control, without planning the rig.
+
+    Args:
+        mesh (str): Source mesh.
+        up_vector_highest (bool): As passed to rig.
+        flip_direction (bool): As passed to rig.
+        prefix (str): Prefix of the preview nodes.
+    """
 
-        # Joint
-        pm.select(clear=True)
-        joint = pm.joint(
-            name="{0}_pop{1:0>2}_jnt".format(prefix, ordered_verts.index(vert))
+    def __init__(self,
+                 mesh,
+                 up_vector_highest=False,
+                 flip_direction=False,
+                 prefix="shrinkwrap_rig"):
+        topology, points = read_mesh_data(mesh)
+        _, _, _, self.matrices = shrinkwrap_plan.solve_ring(
+            topology,
+            points,
+            up_vector_highest=up_vector_highest,
+            flip_direction=flip_direction
         )
-        pm.parentConstraint(control, joint)
+        self.prefix = prefix
+        self.curve = None
+        self.locators = []
+
+    def update(self,
+               main_control_start=0,
+               main_control_frequency=1,
+               control_offset=0.0,
+               control_size=1.0):
+        positions, main_indices = shrinkwrap_plan.preview_positions(
+            self.matrices,
+            main_control_start,
+            main_control_frequency,
+            control_offset
+        )
+        if not positions:
+            return
 
-        results["deformers_group"].append(joint)
-        results["deformers_set"].append(joint)
+        # Preview edits are not worth undoing.
+        cmds.undoInfo(stateWithoutFlush=False)
+        try:
+            self._update(positions, main_indices, control_size)
+        finally:
+            cmds.undoInfo(stateWithoutFlush=True)
+
+    def _update(self, positions, main_indices, control_size):
+        # Closed ring through all controls.
+        points = positions + positions[:1]
+        if self.curve is None:
+            self.curve = cmds.curve(
+                name="{0}_preview_crv".format(self.prefix),
+                degree=1,
+                point=points
+            )
+        else:
+            cmds.setAttr(
+                "{0}.controlPoints[0:{1}]".format(
+                    self.curve, len(points) - 1
+                ),
+                *[value for point in points for value in point]
+            )
 
-    return results
+        while len(self.locators) < len(main_indices):
+            self.locators.append(
+                cmds.spaceLocator(
+                    name="{0}_preview{1:0>2}_loc".format(
+                        self.prefix, len(self.locators)
+                    )
+                )[0]
+            )
+        if len(self.locators) > len(main_indices):
+            cmds.delete(self.locators[len(main_indices):])
+            self.locators = self.locators[:len(main_indices)]
+
+        for locator, index in zip(self.locators, main_indices):
+            cmds.setAttr(locator + ".translate", *positions[index])
+            cmds.setAttr(
+                locator + ".localScale",
+                control_size,
+                control_size,
+                control_size
+            )
+
+    def delete(self):
+        nodes = [
+            x for x in [self.curve] + self.locators
+            if x and cmds.objExists(x)
+        ]
+        if nodes:
+            cmds.undoInfo(stateWithoutFlush=False)
+            try:
+                cmds.delete(nodes)
+            finally:
+                cmds.undoInfo(stateWithoutFlush=True)
+        self.curve = None
+        self.locators = []
 
 
 class ui(MayaQWidgetDockableMixin, QtWidgets.QDialog):
@@ -780,6 +1235,8 @@ class ui(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         )
 
         self.setWindowTitle("Shrinkwrap Rigger")
+        self.build_job = None
+        self.preview = None
 
         self.setWindowFlags(QtCore.Qt.Window)
         self.setAttribute(QtCore.Qt.WA_DeleteOnClose, 1)
@@ -869,6 +1326,18 @@ class ui(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         self.flip_direction = QtWidgets.QCheckBox()
         layout.addWidget(self.flip_direction_label)
         layout.addWidget(self.flip_direction)
+
+        # matrix_network
+        self.matrix_network_label = QtWidgets.QLabel("Matrix Network:")
+        self.matrix_network = QtWidgets.QCheckBox()
+        layout.addWidget(self.matrix_network_label)
+        layout.addWidget(self.matrix_network)
+
+        # profile
+        self.profile_label = QtWidgets.QLabel("Profile:")
+        self.profile = QtWidgets.QCheckBox()
+        layout.addWidget(self.profile_label)
+        layout.addWidget(self.profile)
         self.main_layout.addLayout(layout)
 
         # main_control_start
@@ -972,6 +1441,24 @@ class ui(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         )
 
     def create_footer_layout(self):
+        self.preview_button = QtWidgets.QPushButton("Preview")
+        self.preview_button.setCheckable(True)
+        self.main_layout.addWidget(self.preview_button)
+        self.preview_button.toggled.connect(self.toggle_preview)
+
+        for widget in [
+            self.control_offset,
+            self.control_size,
+            self.main_control_start,
+            self.main_control_frequency
+        ]:
+            widget.valueChanged.connect(self.update_preview)
+
+        # Settings changing the ring solve the preview again.
+        self.mesh.editingFinished.connect(self.reset_preview)
+        self.up_vector_highest.toggled.connect(self.reset_preview)
+        self.flip_direction.toggled.connect(self.reset_preview)
+
         self.build_button = QtWidgets.QPushButton("Build")
         self.main_layout.addWidget(self.build_button)
         self.build_button.clicked.connect(self.build_rig)
@@ -1004,17 +1491,142 @@ class ui(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         else:
             pm.displayWarning("No objects selected.")
 
+    def toggle_preview(self, checked):
+        if checked:
+            self.reset_preview()
+        else:
+            self.delete_preview()
+
+    def reset_preview(self, *args):
+        self.delete_preview()
+        if not self.preview_button.isChecked():
+            return
+
+        mesh = self.mesh.text()
+        if not mesh or not pm.objExists(mesh):
+            pm.displayWarning("No mesh to preview.")
+            self.preview_button.setChecked(False)
+            return
+
+        self.preview = Preview(
+            mesh,
+            up_vector_highest=self.up_vector_highest.isChecked(),
+            flip_direction=self.flip_direction.isChecked(),
+            prefix=self.prefix.text() or "shrinkwrap_rig"
+        )
+        self.update_preview()
+
+    def update_preview(self, *args):
+        if self.preview is None:
+            return
+
+        self.preview.update(
+            main_control_start=self.main_control_start.value(),
+            main_control_frequency=self.main_control_frequency.value(),
+            control_offset=self.control_offset.value(),
+            control_size=self.control_size.value()
+        )
+
+    def delete_preview(self):
+        if self.preview is not None:
+            self.preview.delete()
+            self.preview = None
+
+    def closeEvent(self, event):
+        self.delete_preview()
+        super(ui, self).closeEvent(event)
+
     def build_rig(self):
+        # Building confirms the preview.
+        self.preview_button.setChecked(False)
+
         kwargs = facial_rigger.lib.get_settings_from_widget(self)
-        with pm.UndoChunk():
-            rig(**kwargs)
 
-    def export_settings(self):
-        data_string = json.dumps(
-            facial_rigger.lib.get_settings_from_widget(self),
-            indent=4,
-            sort_keys=True
+        # Profiling measures the build itself, so it runs in one go.
+        if kwargs.get("profile"):
+            with pm.UndoChunk():
+                rig(**kwargs)
+            return
+
+        self.build_job = BuildJob(kwargs)
+        self.build_button.setEnabled(False)
+
+        self.progress_dialog = QtWidgets.QProgressDialog(
+            "Reading meshes", "Cancel", 0, 100, self
         )
+        self.progress_dialog.setWindowTitle("Shrinkwrap Rigger")
+        self.progress_dialog.setMinimumDuration(0)
+        self.progress_dialog.canceled.connect(self.build_job.cancel)
+        self.progress_dialog.show()
+        QtWidgets.QApplication.processEvents()
+
+        try:
+            self.build_job.start()
+        except Exception:
+            self.finish_build()
+            raise
+
+        # Poll the planning, while Maya stays responsive.
+        self.build_timer = QtCore.QTimer(self)
+        self.build_timer.timeout.connect(self.poll_build)
+        self.build_timer.start(50)
+
+    def update_progress(self):
+        self.progress_dialog.setValue(int(self.build_job.progress * 100))
+        self.progress_dialog.setLabelText(self.build_job.message)
+
+    def poll_build(self):
+        self.update_progress()
+        if not self.build_job.planned():
+            return
+
+        self.build_timer.stop()
+        try:
+            plan = self.build_job.plan()
+        except shrinkwrap_plan.Cancelled:
+            self.finish_build()
+            return
+        except Exception:
+            self.finish_build()
+            raise
+
+        # Build on the main thread. Events are processed in batches, so the
+        # dialog stays responsive without slowing the build down. Input
+        # outside the dialog is blocked while the undo chunk is open, so user
+        # edits can not end up in the chunk and be undone with a cancel.
+        self.progress_dialog.hide()
+        self.progress_dialog.setWindowModality(QtCore.Qt.ApplicationModal)
+        self.progress_dialog.show()
+
+        cancelled = False
+        try:
+            with pm.UndoChunk():
+                last_update = time.time()
+                for _ in self.build_job.steps(plan):
+                    if time.time() - last_update < 0.05:
+                        continue
+                    self.update_progress()
+                    QtWidgets.QApplication.processEvents()
+                    last_update = time.time()
+        except shrinkwrap_plan.Cancelled:
+            cancelled = True
+        finally:
+            self.finish_build()
+
+        # Remove the partial build.
+        if cancelled:
+            pm.undo()
+
+    def finish_build(self):
+        self.progress_dialog.close()
+        self.build_button.setEnabled(True)
+        self.build_job = None
+
+    def export_settings(self):
+        # Profiling is a choice per build, not part of the rig.
+        settings = facial_rigger.lib.get_settings_from_widget(self)
+        settings.pop("profile", None)
+        data_string = json.dumps(settings, indent=4, sort_keys=True)
 
         file_path = facial_rigger.lib.get_file_path(self.filter, "save")
         if not file_path:
@@ -1040,10 +1652,18 @@ def rig_from_file(path):
         rig(**json.load(open(path)))
 
 
-# Build from data.
-def rig_from_data(data):
+# Build from data. Plans are cached in cache_directory when given, and the
+# build is profiled to profile_directory when profile is enabled.
+def rig_from_data(data,
+                  cache_directory=None,
+                  profile=False,
+                  profile_directory=None):
+    kwargs = dict(data)
+    kwargs["cache_directory"] = cache_directory
+    kwargs["profile"] = profile
+    kwargs["profile_directory"] = profile_directory
     with pm.UndoChunk():
-        rig(**data)
+        rig(**kwargs)
 
 
 def show(*args):
@@ -0,0 +1,255 @@
+"""
+Headless mesh snapshots for planning shrinkwraps outside of Maya.
+
+A snapshot holds the topology, world positions, vertex normals and UVs of a
+mesh. It is stored like a numpy .npz; a zip of raw little endian arrays and a
+json header, so it loads in plain Python without Maya or numpy.
+
+Snapshots of a mesh and of its smoothed, shrinkwrapped copy are all the
+planning needs, so plans can be solved in worker processes or on machines
+without Maya, and snapshots double as regression fixtures.
+
+Usage:
+    python shrinkwrap_snapshot.py mesh.snapshot smooth.snapshot
+        config.shrinkwrap plan.json
+"""
+
+from array import array
+import json
+import sys
+import zipfile
+
+import shrinkwrap_geometry
+import shrinkwrap_plan
+import shrinkwrap_topology
+
+
+SNAPSHOT_VERSION = 1
+
+
+def _to_bytes(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _flatten(vectors):
+    return array("d", [value for vector in vectors for value in vector])
+
+
+def _vectors(values, size):
+    return [
+        tuple(values[index:index + size])
+        for index in range(0, len(values), size)
+    ]
+
+
+class MeshSnapshot(object):
+    """Topology, positions, normals and UVs of a mesh.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        points (list): World (x, y, z) tuple per vertex.
+        normals (list): World (x, y, z) normal per vertex.
+        uv_counts (list): Number of assigned UVs per face.
+        uv_ids (list): UV index per face vertex, for faces with UVs.
+        us (list): U value per UV index.
+        vs (list): V value per UV index.
+        name (str): Name of the mesh.
+    """
+
+    def __init__(self,
+                 topology,
+                 points,
+                 normals=None,
+                 uv_counts=None,
+                 uv_ids=None,
+                 us=None,
+                 vs=None,
+                 name=""):
+        self.topology = topology
+        self.points = points
+        self.normals = normals or []
+        self.uv_counts = uv_counts or []
+        self.uv_ids = uv_ids or []
+        self.us = us or []
+        self.vs = vs or []
+        self.name = name
+
+    @property
+    def uvs(self):
+        """(u, v) tuple per vertex, or None for vertices without UVs."""
+        if not self.uv_counts:
+            return [None] * self.topology.vertex_count
+
+        return shrinkwrap_geometry.vertex_uvs(
+            self.topology, self.uv_counts, self.uv_ids, self.us, self.vs
+        )
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """Snapshot of a mesh in the scene.
+
+        Args:
+            mesh (str or PyNode): Mesh transform or shape.
+
+        Returns:
+            MeshSnapshot: Snapshot of the mesh.
+        """
+        from maya.api import OpenMaya
+
+        selection = OpenMaya.MSelectionList()
+        selection.add(str(mesh))
+        dag_path = selection.getDagPath(0)
+        dag_path.extendToShape()
+        fn_mesh = OpenMaya.MFnMesh(dag_path)
+
+        us, vs = fn_mesh.getUVs()
+        uv_counts, uv_ids = fn_mesh.getAssignedUVs()
+        normals = fn_mesh.getVertexNormals(False, OpenMaya.MSpace.kWorld)
+
+        return cls(
+            shrinkwrap_topology.MeshTopology.from_mesh(mesh),
+            shrinkwrap_geometry.points_from_mesh(mesh),
+            normals=[(x.x, x.y, x.z) for x in normals],
+            uv_counts=list(uv_counts),
+            uv_ids=list(uv_ids),
+            us=list(us),
+            vs=list(vs),
+            name=str(mesh)
+        )
+
+    def _arrays(self):
+        topology = self.topology
+        return {
+            "edge_vertices": topology.edge_vertices,
+            "face_vertex_counts": topology.face_vertex_counts,
+            "face_vertices": topology.face_vertices,
+            "points": _flatten(self.points),
+            "normals": _flatten(self.normals),
+            "uv_counts": array("i", self.uv_counts),
+            "uv_ids": array("i", self.uv_ids),
+            "us": array("d", self.us),
+            "vs": array("d", self.vs)
+        }
+
+    def save(self, path):
+        arrays = self._arrays()
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "name": self.name,
+            "vertex_count": self.topology.vertex_count,
+            "arrays": dict(
+                (key, values.typecode) for key, values in arrays.items()
+            )
+        }
+
+        # Arrays are stored uncompressed, like numpy.savez.
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as f:
+            f.writestr("header.json", json.dumps(header, sort_keys=True))
+            for key, values in sorted(arrays.items()):
+                f.writestr(key + ".bin", _to_bytes(values))
+
+    @classmethod
+    def load(cls, path):
+        """Load a snapshot.
+
+        Raises:
+            ValueError: When the file is from another snapshot version.
+        """
+        with zipfile.ZipFile(path, "r") as f:
+            header = json.loads(f.read("header.json").decode("utf-8"))
+            if header["version"] != SNAPSHOT_VERSION:
+                raise ValueError(
+                    "Snapshot version {0} is not supported: {1}".format(
+                        header["version"], path
+                    )
+                )
+
+            arrays = {}
+            for key, typecode in header["arrays"].items():
+                arrays[key] = _from_bytes(typecode, f.read(key + ".bin"))
+
+        topology = shrinkwrap_topology.MeshTopology(
+            header["vertex_count"],
+            arrays["edge_vertices"],
+            arrays["face_vertex_counts"],
+            arrays["face_vertices"]
+        )
+        return cls(
+            topology,
+            _vectors(arrays["points"], 3),
+            normals=_vectors(arrays["normals"], 3),
+            uv_counts=list(arrays["uv_counts"]),
+            uv_ids=list(arrays["uv_ids"]),
+            us=list(arrays["us"]),
+            vs=list(arrays["vs"]),
+            name=header["name"]
+        )
+
+
+def plan_from_snapshots(mesh_snapshot, smooth_snapshot, **settings):
+    """Plan a rig from snapshots, without Maya.
+
+    Args:
+        mesh_snapshot (MeshSnapshot): Snapshot of the mesh.
+        smooth_snapshot (MeshSnapshot): Snapshot of the mesh after smoothing
+            and shrinkwrapping.
+        settings: Rig settings, as passed to shrinkwrap_plan.build_plan.
+
+    Returns:
+        dict: Rig plan.
+    """
+    settings.setdefault("mesh", mesh_snapshot.name)
+    return shrinkwrap_plan.build_plan(
+        mesh_snapshot.topology,
+        mesh_snapshot.points,
+        smooth_snapshot.topology,
+        smooth_snapshot.points,
+        smooth_uvs=smooth_snapshot.uvs,
+        **settings
+    )
+
+
+def plan_from_files(mesh_path, smooth_path, settings):
+    """Plan a rig from snapshot files.
+
+    Only takes and returns plain data, so it can run in a worker process.
+    """
+    return plan_from_snapshots(
+        MeshSnapshot.load(mesh_path),
+        MeshSnapshot.load(smooth_path),
+        **settings
+    )
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    if len(args) != 4:
+        print(__doc__.strip())
+        return 1
+
+    mesh_path, smooth_path, settings_path, plan_path = args
+    with open(settings_path, "r") as f:
+        config = json.load(f)
+    settings = dict(
+        (key, value) for key, value in config.items()
+        if key in shrinkwrap_plan.SETTINGS
+    )
+
+    plan = plan_from_files(mesh_path, smooth_path, settings)
+    shrinkwrap_plan.save_plan(plan, plan_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
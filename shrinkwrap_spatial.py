@@ -0,0 +1,192 @@
+"""
+Maya independent spatial index for closest vertex queries.
+
+Distances and tie breaking match a brute force scan over the points in list
+order, where the first point with the smallest distance wins.
+"""
+
+import heapq
+import math
+import random
+import time
+
+
+def _distance(a, b):
+    x = a[0] - b[0]
+    y = a[1] - b[1]
+    z = a[2] - b[2]
+    return math.sqrt(x * x + y * y + z * z)
+
+
+def closest_point(position, points):
+    """Brute force closest point.
+
+    Args:
+        position (tuple): (x, y, z) position to search from.
+        points (list): (x, y, z) tuples to search.
+
+    Returns:
+        int: Index of the closest point, or None when there are no points.
+    """
+    closest_distance = None
+    closest_index = None
+    for index, point in enumerate(points):
+        distance = _distance(position, point)
+        if closest_distance is None or distance < closest_distance:
+            closest_distance = distance
+            closest_index = index
+
+    return closest_index
+
+
+class KDTree(object):
+    """KD-tree over a list of points.
+
+    Args:
+        points (list): (x, y, z) tuples.
+        leaf_size (int): Maximum number of points in a leaf.
+    """
+
+    def __init__(self, points, leaf_size=8):
+        self.points = list(points)
+        self.leaf_size = leaf_size
+        self._indices = list(range(len(self.points)))
+
+        # Nodes are [axis, split, left, right, start, end]. Leaves have an
+        # axis of -1 and hold the indices between start and end.
+        self._nodes = []
+        if self.points:
+            self._build(0, len(self.points))
+
+    def _build(self, start, end):
+        node_id = len(self._nodes)
+        self._nodes.append([-1, 0.0, -1, -1, start, end])
+        if end - start <= self.leaf_size:
+            return node_id
+
+        # Split on the axis with the largest spread.
+        indices = self._indices[start:end]
+        spreads = []
+        for axis in range(3):
+            values = [self.points[x][axis] for x in indices]
+            spreads.append(max(values) - min(values))
+        axis = spreads.index(max(spreads))
+
+        indices.sort(key=lambda x: self.points[x][axis])
+        self._indices[start:end] = indices
+        middle = (start + end) // 2
+
+        node = self._nodes[node_id]
+        node[0] = axis
+        node[1] = self.points[self._indices[middle]][axis]
+        node[2] = self._build(start, middle)
+        node[3] = self._build(middle, end)
+        return node_id
+
+    def _search(self, position, visit, bound):
+        """Visit every leaf that can hold a point within bound()."""
+        if not self._nodes:
+            return
+
+        stack = [(0, 0.0)]
+        while stack:
+            node_id, plane_distance = stack.pop()
+            if plane_distance > bound():
+                continue
+
+            axis, split, left, right, start, end = self._nodes[node_id]
+            if axis == -1:
+                for index in self._indices[start:end]:
+                    visit(index, _distance(position, self.points[index]))
+                continue
+
+            difference = position[axis] - split
+            near, far = (left, right) if difference < 0 else (right, left)
+            stack.append((far, max(plane_distance, abs(difference))))
+            stack.append((near, plane_distance))
+
+    def nearest(self, position):
+        """Index of the closest point.
+
+        Args:
+            position (tuple): (x, y, z) position to search from.
+
+        Returns:
+            int: Index into points, or None when the tree is empty.
+        """
+        best = [float("inf"), None]
+
+        def visit(index, distance):
+            if distance < best[0] or (
+                distance == best[0] and index < best[1]
+            ):
+                best[0] = distance
+                best[1] = index
+
+        self._search(position, visit, lambda: best[0])
+        return best[1]
+
+    def k_nearest(self, position, k):
+        """Indices of the k closest points, closest first.
+
+        Args:
+            position (tuple): (x, y, z) position to search from.
+            k (int): Number of points to return.
+
+        Returns:
+            list: Indices into points.
+        """
+        # Max heap of the best candidates, using negated keys.
+        heap = []
+
+        def visit(index, distance):
+            key = (-distance, -index)
+            if len(heap) < k:
+                heapq.heappush(heap, key)
+            elif key > heap[0]:
+                heapq.heapreplace(heap, key)
+
+        def bound():
+            if len(heap) < k:
+                return float("inf")
+            return -heap[0][0]
+
+        if k > 0:
+            self._search(position, visit, bound)
+        return [-index for _, index in sorted(heap, reverse=True)]
+
+
+def _benchmark(sizes=(1000, 4000, 16000), queries=200):
+    """Compare brute force and KD-tree closest point queries."""
+    for size in sizes:
+        points = [
+            (random.random(), random.random(), random.random())
+            for _ in range(size)
+        ]
+        positions = [
+            (random.random(), random.random(), random.random())
+            for _ in range(queries)
+        ]
+
+        start = time.time()
+        brute_force = [closest_point(x, points) for x in positions]
+        brute_force_time = time.time() - start
+
+        start = time.time()
+        tree = KDTree(points)
+        build_time = time.time() - start
+        start = time.time()
+        indexed = [tree.nearest(x) for x in positions]
+        query_time = time.time() - start
+
+        assert brute_force == indexed
+        print(
+            "{0} points: brute force {1:.4f}s, kd-tree build {2:.4f}s,"
+            " query {3:.4f}s".format(
+                size, brute_force_time, build_time, query_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    _benchmark()
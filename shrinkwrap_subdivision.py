@@ -0,0 +1,149 @@
+"""
+Maya independent mapping of mesh components through polySmooth.
+
+polySmooth keeps the indices of the original vertices, and splits every edge
+into 2 ** divisions edges along a straight line of new vertices. Instead of
+searching the smoothed mesh for shortest paths, these lines are walked
+directly: from an edge's first vertex, through the vertex opposite the
+incoming edge, for a known number of steps. The walk is O(2 ** divisions) per
+edge where a breadth first search grows with the area around it.
+
+The mapping is checked once against the smoothed mesh by its component
+counts, and every walk is checked to end at the expected vertex. Anything
+that does not check out falls back to a shortest path search.
+"""
+
+import shrinkwrap_paths
+
+
+def subdivided_counts(topology, divisions):
+    """Vertex, edge and face counts after Catmull-Clark subdivision.
+
+    Args:
+        topology (MeshTopology): Topology before subdividing.
+        divisions (int): Number of subdivision levels.
+
+    Returns:
+        tuple: Vertex, edge and face count.
+    """
+    vertex_count = topology.vertex_count
+    edge_count = topology.edge_count
+    face_count = topology.face_count
+    face_vertex_count = len(topology.face_vertices)
+    for _ in range(divisions):
+        vertex_count += edge_count + face_count
+        edge_count = edge_count * 2 + face_vertex_count
+        face_count = face_vertex_count
+        face_vertex_count = face_count * 4
+
+    return vertex_count, edge_count, face_count
+
+
+def _opposite_edge(topology, vertex, edge):
+    """The edge continuing a straight line through a vertex, or None.
+
+    Border lines continue along the border. Inside the mesh the line
+    continues through the one edge sharing no face with the incoming edge.
+    """
+    if topology.is_boundary(edge):
+        candidates = [
+            x for x in topology.vertex_edges_of(vertex)
+            if x != edge and topology.is_boundary(x)
+        ]
+    else:
+        faces = set(topology.edge_faces_of(edge))
+        candidates = [
+            x for x in topology.vertex_edges_of(vertex)
+            if x != edge and not faces.intersection(topology.edge_faces_of(x))
+        ]
+
+    if len(candidates) != 1:
+        return None
+    return candidates[0]
+
+
+def straight_path(topology, source, target, steps):
+    """Straight edge line of a given length between two vertices.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        source (int): Vertex index to start from.
+        target (int): Vertex index to end at.
+        steps (int): Number of edges along the line.
+
+    Returns:
+        list: Vertex indices along the line, or None when no straight line
+            of that length connects the vertices.
+    """
+    for first_edge in topology.vertex_edges_of(source):
+        path = [source]
+        edge = first_edge
+        while edge is not None:
+            path.append(topology.other_vertex(edge, path[-1]))
+            if len(path) > steps:
+                break
+            edge = _opposite_edge(topology, path[-1], edge)
+
+        if len(path) == steps + 1 and path[-1] == target:
+            return path
+
+    return None
+
+
+class SubdivisionMap(object):
+    """Maps vertices and edges of a mesh to the mesh after polySmooth.
+
+    Args:
+        topology (MeshTopology): Topology before smoothing.
+        smooth_topology (MeshTopology): Topology after smoothing.
+        divisions (int): Divisions polySmooth was run with.
+    """
+
+    def __init__(self, topology, smooth_topology, divisions):
+        self.topology = topology
+        self.smooth_topology = smooth_topology
+        self.steps = 2 ** divisions
+
+        # Check the smoothed mesh is a plain subdivision once, so the walks
+        # can be trusted.
+        self.valid = subdivided_counts(topology, divisions) == (
+            smooth_topology.vertex_count,
+            smooth_topology.edge_count,
+            smooth_topology.face_count
+        )
+
+    def path(self, source, target, steps=None):
+        """Vertices between two smoothed mesh vertices.
+
+        Args:
+            source (int): Vertex index in the smoothed mesh.
+            target (int): Vertex index in the smoothed mesh.
+            steps (int): Expected number of edges between the vertices.
+                Defaults to the length of one subdivided edge.
+
+        Returns:
+            list: Vertex indices from source to target.
+        """
+        if self.valid:
+            path = straight_path(
+                self.smooth_topology,
+                source,
+                target,
+                self.steps if steps is None else steps
+            )
+            if path is not None:
+                return path
+
+        path, _ = shrinkwrap_paths.shortest_path(
+            self.smooth_topology, source, target
+        )
+        return path
+
+    def edge_path(self, edge):
+        """Vertices of the smoothed mesh along an original edge."""
+        return self.path(*self.topology.edge_verts(edge))
+
+    def edge_midpoint(self, edge):
+        """Vertex of the smoothed mesh in the middle of an original edge."""
+        path = self.edge_path(edge)
+        return path[(len(path) - 1) // 2]
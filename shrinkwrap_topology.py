@@ -0,0 +1,369 @@
+"""
+Maya independent mesh topology for the shrinkwrap rigger.
+
+The topology of a mesh is pulled once into flat integer arrays, so border
+splitting, ring ordering and edge lookups can run without any scene queries.
+Only MeshTopology.from_mesh needs Maya, which makes everything else usable on
+synthetic meshes outside of Maya.
+"""
+
+from array import array
+
+
+def _offsets(counts):
+    """Running offsets for compressed rows, with the total as last entry."""
+    offsets = array("i", [0]) * (len(counts) + 1)
+    total = 0
+    for index, count in enumerate(counts):
+        offsets[index] = total
+        total += count
+    offsets[len(counts)] = total
+    return offsets
+
+
+class MeshTopology(object):
+    """Flat array topology of a polygon mesh.
+
+    Args:
+        vertex_count (int): Number of vertices.
+        edge_vertices (list): Two vertex indices per edge, flattened.
+        face_vertex_counts (list): Number of vertices per face.
+        face_vertices (list): Vertex indices per face, flattened.
+    """
+
+    def __init__(self,
+                 vertex_count,
+                 edge_vertices,
+                 face_vertex_counts,
+                 face_vertices):
+        self.vertex_count = vertex_count
+        self.edge_vertices = array("i", edge_vertices)
+        self.edge_count = len(self.edge_vertices) // 2
+        self.face_vertex_counts = array("i", face_vertex_counts)
+        self.face_vertices = array("i", face_vertices)
+        self.face_count = len(self.face_vertex_counts)
+        self.face_offsets = _offsets(self.face_vertex_counts)
+
+        # Vertex to edge adjacency. Edges are stored in ascending order per
+        # vertex.
+        counts = [0] * vertex_count
+        for vertex in self.edge_vertices:
+            counts[vertex] += 1
+        self.vertex_edge_offsets = _offsets(counts)
+        self.vertex_edges = array("i", [0]) * len(self.edge_vertices)
+        fill = list(self.vertex_edge_offsets[:-1])
+        for index, vertex in enumerate(self.edge_vertices):
+            self.vertex_edges[fill[vertex]] = index // 2
+            fill[vertex] += 1
+
+        # Face to edge mapping. Each face vertex is paired with the edge
+        # going to the next vertex in the face.
+        edge_lookup = {}
+        for edge in range(self.edge_count):
+            a = self.edge_vertices[edge * 2]
+            b = self.edge_vertices[edge * 2 + 1]
+            edge_lookup[(min(a, b), max(a, b))] = edge
+
+        self.face_edges = array("i", [0]) * len(self.face_vertices)
+        counts = [0] * self.edge_count
+        for face in range(self.face_count):
+            start = self.face_offsets[face]
+            end = self.face_offsets[face + 1]
+            for index in range(start, end):
+                a = self.face_vertices[index]
+                b = self.face_vertices[index + 1 if index + 1 < end else start]
+                edge = edge_lookup[(min(a, b), max(a, b))]
+                self.face_edges[index] = edge
+                counts[edge] += 1
+
+        # Edge to face adjacency.
+        self.edge_face_offsets = _offsets(counts)
+        self.edge_faces = array("i", [0]) * len(self.face_vertices)
+        fill = list(self.edge_face_offsets[:-1])
+        for face in range(self.face_count):
+            start = self.face_offsets[face]
+            end = self.face_offsets[face + 1]
+            for index in range(start, end):
+                edge = self.face_edges[index]
+                self.edge_faces[fill[edge]] = face
+                fill[edge] += 1
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """Read the topology of a mesh in the scene.
+
+        Args:
+            mesh (str or PyNode): Mesh transform or shape.
+
+        Returns:
+            MeshTopology: Topology of the mesh.
+        """
+        from maya.api import OpenMaya
+
+        selection = OpenMaya.MSelectionList()
+        selection.add(str(mesh))
+        dag_path = selection.getDagPath(0)
+        dag_path.extendToShape()
+        fn_mesh = OpenMaya.MFnMesh(dag_path)
+
+        face_vertex_counts, face_vertices = fn_mesh.getVertices()
+        edge_vertices = []
+        for edge in range(fn_mesh.numEdges):
+            edge_vertices.extend(fn_mesh.getEdgeVertices(edge))
+
+        return cls(
+            fn_mesh.numVertices,
+            edge_vertices,
+            list(face_vertex_counts),
+            list(face_vertices)
+        )
+
+    def edge_verts(self, edge):
+        return self.edge_vertices[edge * 2:edge * 2 + 2]
+
+    def vertex_edges_of(self, vertex):
+        return self.vertex_edges[
+            self.vertex_edge_offsets[vertex]:
+            self.vertex_edge_offsets[vertex + 1]
+        ]
+
+    def edge_faces_of(self, edge):
+        return self.edge_faces[
+            self.edge_face_offsets[edge]:self.edge_face_offsets[edge + 1]
+        ]
+
+    def face_verts(self, face):
+        return self.face_vertices[
+            self.face_offsets[face]:self.face_offsets[face + 1]
+        ]
+
+    def other_vertex(self, edge, vertex):
+        a = self.edge_vertices[edge * 2]
+        if a == vertex:
+            return self.edge_vertices[edge * 2 + 1]
+        return a
+
+    def connected_vertices(self, vertex):
+        return [
+            self.other_vertex(edge, vertex)
+            for edge in self.vertex_edges_of(vertex)
+        ]
+
+    def is_boundary(self, edge):
+        offsets = self.edge_face_offsets
+        return offsets[edge + 1] - offsets[edge] == 1
+
+    def boundary_edges(self):
+        return [x for x in range(self.edge_count) if self.is_boundary(x)]
+
+    def connecting_edges(self):
+        return [
+            x for x in range(self.edge_count) if not self.is_boundary(x)
+        ]
+
+
+def split_borders(topology):
+    """Split the boundary edges into connected borders.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+
+    Returns:
+        list: Lists of edge indices, one per border. Edges within a border
+            are ascending and borders are ordered by their lowest edge.
+    """
+    visited = set()
+    borders = []
+    for edge in topology.boundary_edges():
+        if edge in visited:
+            continue
+
+        visited.add(edge)
+        border = [edge]
+        stack = [edge]
+        while stack:
+            current = stack.pop()
+            for vertex in topology.edge_verts(current):
+                for connected_edge in topology.vertex_edges_of(vertex):
+                    if connected_edge in visited:
+                        continue
+                    if not topology.is_boundary(connected_edge):
+                        continue
+                    visited.add(connected_edge)
+                    border.append(connected_edge)
+                    stack.append(connected_edge)
+
+        borders.append(sorted(border))
+
+    return borders
+
+
+def unique_edge_vertices(topology, edges):
+    """Unique vertices of edges, in the order they are found.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        edges (list): Edge indices.
+
+    Returns:
+        list: Vertex indices.
+    """
+    results = []
+    found = set()
+    for edge in edges:
+        for vertex in topology.edge_verts(edge):
+            if vertex in found:
+                continue
+            found.add(vertex)
+            results.append(vertex)
+
+    return results
+
+
+def vertex_adjacency(topology, vertices=None, edges=None):
+    """Adjacency map of vertices, restricted to vertices or edges.
+
+    Neighbours are listed in the order of the vertex edges.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        vertices (list): Only connect these vertices.
+        edges (list): Only connect through these edges.
+
+    Returns:
+        dict: Vertex index to list of neighbouring vertex indices.
+    """
+    if edges is not None:
+        edges = set(edges)
+        if vertices is None:
+            vertices = unique_edge_vertices(topology, sorted(edges))
+
+    if vertices is None:
+        vertices = range(topology.vertex_count)
+    members = set(vertices)
+
+    adjacency = {}
+    for vertex in vertices:
+        neighbours = []
+        for edge in topology.vertex_edges_of(vertex):
+            if edges is not None and edge not in edges:
+                continue
+            other = topology.other_vertex(edge, vertex)
+            if other in members and other not in neighbours:
+                neighbours.append(other)
+        adjacency[vertex] = neighbours
+
+    return adjacency
+
+
+def _walk(adjacency, first, found):
+    results = []
+    current = first
+    while current is not None:
+        found.add(current)
+        results.append(current)
+        next_vertex = None
+        for vertex in adjacency[current]:
+            if vertex not in found:
+                next_vertex = vertex
+                break
+        current = next_vertex
+
+    return results
+
+
+def walk_loop(adjacency, start, reverse=False):
+    """Order vertices by walking an adjacency map once.
+
+    The walk leaves the start vertex through its first neighbour, or its last
+    neighbour when reversed. Open strips are walked in both directions from
+    the start, so the result always covers the whole strip.
+
+    Args:
+        adjacency (dict): Vertex index to list of neighbouring vertex indices.
+        start (int): Vertex index to start from.
+        reverse (bool): Walk in the opposite direction.
+
+    Returns:
+        tuple: Ordered vertex indices and whether the loop is closed.
+    """
+    neighbours = list(adjacency[start])
+    if reverse:
+        neighbours.reverse()
+
+    found = set([start])
+    forward = []
+    if neighbours:
+        forward = _walk(adjacency, neighbours[0], found)
+
+    # Closed when the walk comes back around next to the start.
+    closed = len(forward) > 1 and start in adjacency[forward[-1]]
+    if closed:
+        return [start] + forward, True
+
+    backward = []
+    for vertex in neighbours[1:]:
+        if vertex not in found:
+            backward = _walk(adjacency, vertex, found)
+            break
+    backward.reverse()
+
+    return backward + [start] + forward, False
+
+
+def order_ring(topology, edges, reverse=False):
+    """Order the vertices of connected edges by edge connection.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        edges (list): Edge indices forming a ring or strip.
+        reverse (bool): Walk in the opposite direction.
+
+    Returns:
+        list: Vertex indices ordered by connection, starting from the first
+            vertex of the first edge.
+    """
+    adjacency = vertex_adjacency(topology, edges=edges)
+    if not adjacency:
+        return []
+
+    start = unique_edge_vertices(topology, sorted(edges))[0]
+    return walk_loop(adjacency, start, reverse)[0]
+
+
+def ring_connecting_edges(topology, ordered_vertices):
+    """Connecting (non boundary) edges in the order of the ring vertices.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        ordered_vertices (list): Ordered vertex indices.
+
+    Returns:
+        list: Edge indices.
+    """
+    results = []
+    for vertex in ordered_vertices:
+        for edge in topology.vertex_edges_of(vertex):
+            if not topology.is_boundary(edge):
+                results.append(edge)
+
+    return results
+
+
+def edge_weights(topology, edges, influences):
+    """Sparse weight table binding the verts of each edge to one influence.
+
+    Args:
+        topology (MeshTopology): Mesh topology.
+        edges (list): Edge indices.
+        influences (list): Influence per edge.
+
+    Returns:
+        dict: Vertex index to dictionary of influence to weight.
+    """
+    weights = {}
+    for edge, influence in zip(edges, influences):
+        for vertex in topology.edge_verts(edge):
+            weights.setdefault(vertex, {})[influence] = 1.0
+
+    return weights
@@ -0,0 +1,157 @@
+"""
+Bulk skin weight writing.
+
+Weights are given as a sparse table and written to a skin cluster with one
+setAttr per vertex on its weightList, instead of one skinPercent call per
+vertex and influence. Unlike MFnSkinCluster.setWeights, setAttr goes through
+the undo queue, so builds can be undone and redone safely.
+"""
+
+from maya import cmds
+from maya.api import OpenMaya, OpenMayaAnim
+
+
+def _dag_path(node):
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(node))
+    return selection.getDagPath(0)
+
+
+def dense_weights(vertex_count, influence_count, sparse_weights):
+    """Expand a sparse weight table to a flat vertex major list.
+
+    Args:
+        vertex_count (int): Number of vertices.
+        influence_count (int): Number of influences.
+        sparse_weights (dict): Vertex index to dictionary of influence index
+            to weight.
+
+    Returns:
+        list: influence_count weights per vertex. Missing weights are zero.
+    """
+    weights = [0.0] * (vertex_count * influence_count)
+    for vertex, influences in sparse_weights.items():
+        offset = vertex * influence_count
+        for influence, weight in influences.items():
+            weights[offset + influence] = weight
+
+    return weights
+
+
+def _runs(indices):
+    """Split sorted indices into runs of consecutive indices."""
+    runs = []
+    for index in indices:
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+def set_weights(skin_cluster, mesh, sparse_weights, normalize=False):
+    """Write a sparse weight table to a skin cluster, undoably.
+
+    Every vertex of the mesh is written, so influences that are not in the
+    table end up with zero weight. The skin cluster is read through the API,
+    and the weights are written with setAttr on weightList, one call per
+    vertex for each run of consecutive influence indices.
+
+    Args:
+        skin_cluster (str or PyNode): Skin cluster to write to.
+        mesh (str or PyNode): Mesh deformed by the skin cluster.
+        sparse_weights (dict): Vertex index to dictionary of influence to
+            weight. Influences are nodes or node names.
+        normalize (bool): Normalize the weights of each vertex when writing.
+
+    Returns:
+        list: The previous weights, influence count values per vertex.
+    """
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(skin_cluster))
+    fn_skin = OpenMayaAnim.MFnSkinCluster(selection.getDependNode(0))
+
+    mesh_path = _dag_path(mesh)
+    mesh_path.extendToShape()
+    vertex_count = OpenMaya.MFnMesh(mesh_path).numVertices
+
+    # Map influences to their physical index in the skin cluster, and
+    # physical indices to the logical indices of the weightList plugs.
+    influence_indices = {}
+    logical_indices = []
+    for index, path in enumerate(fn_skin.influenceObjects()):
+        influence_indices[path.fullPathName()] = index
+        logical_indices.append(fn_skin.indexForInfluenceObject(path))
+
+    indexed_weights = {}
+    lookup = {}
+    for vertex, influences in sparse_weights.items():
+        indexed_weights[vertex] = {}
+        for influence, weight in influences.items():
+            if influence not in lookup:
+                lookup[influence] = influence_indices[
+                    _dag_path(influence).fullPathName()
+                ]
+            indexed_weights[vertex][lookup[influence]] = weight
+
+    influence_count = len(influence_indices)
+    weights = dense_weights(vertex_count, influence_count, indexed_weights)
+
+    fn_component = OpenMaya.MFnSingleIndexedComponent()
+    components = fn_component.create(OpenMaya.MFn.kMeshVertComponent)
+    fn_component.addElements(list(range(vertex_count)))
+    old_weights, _ = fn_skin.getWeights(mesh_path, components)
+
+    physical_order = sorted(
+        range(influence_count), key=lambda x: logical_indices[x]
+    )
+    runs = _runs([logical_indices[x] for x in physical_order])
+    name = fn_skin.name()
+    for vertex in range(vertex_count):
+        values = weights[
+            vertex * influence_count:(vertex + 1) * influence_count
+        ]
+        if normalize:
+            total = sum(values)
+            if total:
+                values = [value / total for value in values]
+
+        # Values in logical index order, matching the runs.
+        values = [values[x] for x in physical_order]
+        offset = 0
+        for run in runs:
+            cmds.setAttr(
+                "{0}.weightList[{1}].weights[{2}:{3}]".format(
+                    name, vertex, run[0], run[-1]
+                ),
+                *values[offset:offset + len(run)],
+                size=len(run)
+            )
+            offset += len(run)
+
+    return list(old_weights)
+
+
+def get_weights(skin_cluster, mesh):
+    """Read all weights of a skin cluster in one call.
+
+    Args:
+        skin_cluster (str or PyNode): Skin cluster to read.
+        mesh (str or PyNode): Mesh deformed by the skin cluster.
+
+    Returns:
+        list: Influence count weights per vertex, in physical influence
+            order.
+    """
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(skin_cluster))
+    fn_skin = OpenMayaAnim.MFnSkinCluster(selection.getDependNode(0))
+
+    mesh_path = _dag_path(mesh)
+    mesh_path.extendToShape()
+    fn_component = OpenMaya.MFnSingleIndexedComponent()
+    components = fn_component.create(OpenMaya.MFn.kMeshVertComponent)
+    fn_component.setCompleteData(OpenMaya.MFnMesh(mesh_path).numVertices)
+
+    weights, _ = fn_skin.getWeights(mesh_path, components)
+    return list(weights)